@@ -12,13 +12,241 @@ This simulation shows two outcomes:
 """
 
 """import modules"""
+import argparse
+import contextlib
+import hashlib
+import importlib.util
+import itertools
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+import tempfile
+import tracemalloc
+import warnings
+import weakref
+import zipfile
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from time import perf_counter
+
 import numpy as np
-import matplotlib.pyplot as plt
+prange = range #numba.prange once the numba backend is first used, see _CompiledKernel
+_compiled_kernel = None
+
+LEAVING = 2 #added to the trait of an agent that leaves its group, see Population.Regroup
+CHUNK = 2**16 #default agents per chunk of Population, bounds the scratch arrays of each phase
+_NO_PHASE = contextlib.nullcontext() #Profiler.Phase when it is disabled
+ENGINE_VERSION = 3 #part of the ResultCache key, increase it when a change alters the results of a seed
+
+"""Define functions"""
+
+def _SegmentSum(values, offsets):
+    """
+    Sum of values over the segments values[offsets[i]:offsets[i+1]]
+    
+    Returns
+    -------
+    sum of each segment, array
+    """
+    total = np.concatenate(([0], np.cumsum(values, dtype=np.int64)))
+    return total[offsets[1:]] - total[offsets[:-1]]
+
+def _Hypergeometric(rng, ngood, nbad, nsample):
+    """
+    Hypergeometric draws from the generator rng, falling back
+    to a binomial for groups too large for numpy's hypergeometric
+    
+    Returns
+    -------
+    number of good items in each sample, array
+    """
+    ngood, nbad, nsample = np.broadcast_arrays(ngood, nbad, nsample)
+    drawn = np.zeros(ngood.shape, dtype=np.int64)
+    exact = (ngood < 10**9) & (nbad < 10**9)
+    if exact.all():
+        return rng.hypergeometric(ngood, nbad, nsample).astype(np.int64)
+    drawn[exact] = rng.hypergeometric(ngood[exact], nbad[exact], nsample[exact])
+    large = (nsample > 0) & ~exact
+    if large.any():
+        drawn[large] = rng.binomial(nsample[large], ngood[large] / (ngood[large] + nbad[large]))
+    return drawn
+
+def _GroupStrength(rng, altruists, size, baseline_value, b, c):
+    """
+    Mean payoff of groups from their composition. A round's total payoff only 
+    depends on how many altruists played: every playing altruist gives b to its 
+    partner and pays c. So the mean payoff is baseline + (b-c) * playing altruists / size,
+    where in an odd group the agent sitting out is an altruist with probability altruists / size.
+    
+    Returns
+    -------
+    mean payoff of each group, array (empty group: -inf)
+    """
+    altruists = np.asarray(altruists)
+    size = np.asarray(size)
+    sit_out = (size % 2 == 1) & (rng.random(size.shape) * size < altruists)
+    strength = np.full(size.shape, -np.inf)
+    filled = size > 0
+    strength[filled] = baseline_value + (b-c) * (altruists[filled] - sit_out[filled]) / size[filled]
+    return strength
+
+def _RemoveFile(path):
+    """
+    Remove a file if it can be removed, e.g. a memmap file that is still mapped on Windows can not
+    
+    Returns
+    -------
+    None
+    """
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def _Plain(value):
+    """
+    Copy of value with the numpy scalars and arrays, also inside dicts, lists and tuples,
+    turned into Python numbers and lists, so that json can write it
+    
+    Returns
+    -------
+    value for json
+    """
+    if isinstance(value, dict):
+        return {key: _Plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_Plain(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
+def _GenerationKernel(traits, spare, payoff, offsets, payoff_table, baseline_value, e, m, seeds):
+    """
+    One generation of every group, from the shuffle to the migration draw, over the flat 
+    population. Written for numba (nopython, groups in parallel). Each group seeds its own 
+    random stream from seeds[group], so the result does not depend on the number of threads.
+    The new traits are written in spare, migrants are flagged (+LEAVING). Once a group is 
+    selected its payoffs are not needed any more, so payoff then holds the destination group 
+    of every agent, -1 for the agents staying.
+    
+    Returns
+    -------
+    None
+    """
+    number_of_groups = len(offsets) - 1
+    for g in prange(number_of_groups):
+        np.random.seed(seeds[g])
+        start = offsets[g]
+        stop = offsets[g+1]
+        n = stop - start
+        for i in range(n - 1, 0, -1): #shuffle the group
+            j = np.random.randint(0, i + 1)
+            swap = traits[start+i]
+            traits[start+i] = traits[start+j]
+            traits[start+j] = swap
+        
+        players = n - n % 2 #odd group, the last agent will not play
+        for i in range(start, start + players, 2):
+            payoff[i] = payoff_table[traits[i], traits[i+1]]
+            payoff[i+1] = payoff_table[traits[i+1], traits[i]]
+        if n % 2 == 1:
+            payoff[stop-1] = baseline_value
+        
+        total = 0.0 #the payoffs become the roulette wheel
+        for i in range(start, stop):
+            total += payoff[i]
+            payoff[i] = total
+        for i in range(start, stop):
+            spin = np.random.random() * total
+            low = start
+            high = stop - 1
+            while low < high:
+                middle = (low + high) // 2
+                if payoff[middle] > spin:
+                    high = middle
+                else:
+                    low = middle + 1
+            spare[i] = traits[low]
+        
+        if e > 0: #geometric skip to the next mutant
+            i = start - 1 + np.random.geometric(e)
+            while i < stop:
+                spare[i] = np.random.randint(0, 2)
+                i += np.random.geometric(e)
+        
+        for i in range(start, stop):
+            payoff[i] = -1
+            if number_of_groups > 1 and np.random.random() < m:
+                payoff[i] = (g + np.random.randint(1, number_of_groups)) % number_of_groups
+                spare[i] += LEAVING
+
+def _CompiledKernel():
+    """
+    _GenerationKernel compiled by numba. numba is imported and the kernel compiled 
+    on first use only, numba takes long to import.
+    
+    Returns
+    -------
+    compiled function
+    """
+    global _compiled_kernel, prange
+    if _compiled_kernel is None:
+        import numba
+        prange = numba.prange
+        _compiled_kernel = numba.njit(parallel=True, cache=True)(_GenerationKernel)
+    return _compiled_kernel
 
 """Define classes"""
 
+class AliasTable():
+    def __init__(self, weights):
+        """
+        Walker/Vose alias table, draw an index with probability proportional
+        to its weight in constant time per draw
+        
+        Parameters
+        ----------
+        weights: non negative weights, array like
+        
+        """
+        weights = np.asarray(weights, dtype=float)
+        n = len(weights)
+        scaled = weights * n / weights.sum()
+        self.probability = np.ones(n) #keep own index with this probability
+        self.alias = np.arange(n) #otherwise take this index
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.probability[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] - (1.0 - scaled[s])
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        
+    def Draw(self, size, rng):
+        """
+        Draw indexes from the table with the generator rng
+        
+        Returns
+        -------
+        array of drawn indexes
+        """
+        index = rng.integers(0, len(self.probability), size)
+        keep = rng.random(size) < self.probability[index]
+        return np.where(keep, index, self.alias[index])
+
+
 class GroupOfAgent():
-    def __init__(self, number_of_groups, number_of_agents):
+    def __init__(self, number_of_groups, number_of_agents, rng = None):
         """
         Set the initial variables
         
@@ -26,10 +254,12 @@ class GroupOfAgent():
         ----------
         number_of_groups : int, total groups 
         number_of_agents : int, total agents
+        rng : numpy random Generator, default a new unseeded one
         
         """
         self.number_of_groups = number_of_groups
         self.number_of_agents = number_of_agents
+        self.rng = np.random.default_rng() if rng is None else rng
         self.Groups = []
         
     def Setup(self):
@@ -44,55 +274,306 @@ class GroupOfAgent():
         if self.number_of_agents % self.number_of_groups == 0:  #each group will have same population
             agent_each_group = self.number_of_agents // self.number_of_groups
             for i in range(self.number_of_groups):
-                group = []
-                for j in range(agent_each_group):
-                    agent = np.random.choice([1,0])
-                    group.append(agent)
+                group = self.rng.integers(0, 2, agent_each_group).tolist()
                 self.Groups.append(group)
             return self.Groups
         else: #odd
             agent_each_group = self.number_of_agents // self.number_of_groups
             for i in range(self.number_of_groups):
-                group = []
-                for j in range(agent_each_group):
-                    agent = np.random.choice([1,0])
-                    group.append(agent)
+                group = self.rng.integers(0, 2, agent_each_group).tolist()
                 self.Groups.append(group)
-            extra_agent = np.random.choice([1,0])
-            group_index = np.random.randint(0,self.number_of_groups)
+            extra_agent = int(self.rng.integers(0, 2))
+            group_index = self.rng.integers(0,self.number_of_groups)
             self.Groups[group_index].append(extra_agent)
             return self.Groups
         
+    def SetupCounts(self, replicates = None):
+        """
+        Same population as Setup, but only the number of Altruistic agents and 
+        the size of each group are created
+        
+        Parameters
+        ----------
+        replicates: number of independent populations, default None (one population)
+    
+        Returns
+        -------
+        altruists: number of Altruistic agents of each group, array (replicates, groups) if replicates
+        size: number of agents of each group, array (replicates, groups) if replicates
+        """
+        size = self.GroupsSize(1 if replicates is None else replicates)
+        altruists = self.rng.binomial(size, 0.5)
+        if replicates is None:
+            return altruists[0], size[0]
+        return altruists, size
+    
+    def SetupPopulation(self, directory = None, chunk = None, size = None):
+        """
+        Same population as Setup, created chunk by chunk directly in a Population,
+        without building the groups as lists first
+        
+        Parameters
+        ----------
+        directory, chunk: see Population
+        size: number of agents of each group, default drawn like Setup
+    
+        Returns
+        -------
+        Population
+        """
+        size = self.GroupsSize(1)[0] if size is None else size
+        population = Population(None, size, directory=directory, chunk=chunk)
+        for first, end in population.Chunks():
+            start, stop = population.offsets[first], population.offsets[end]
+            population.traits[start:stop] = self.rng.integers(0, 2, stop - start, dtype=np.uint8)
+        return population
+    
+    def GroupsSize(self, rows):
+        """
+        Size of each group, each group has the same population and, if the agents
+        can not be shared equally, one random group gets one extra agent
+        
+        Returns
+        -------
+        number of agents of each group, array (rows, groups)
+        """
+        size = np.full((rows, self.number_of_groups), self.number_of_agents // self.number_of_groups, dtype=np.int64)
+        if self.number_of_agents % self.number_of_groups != 0: #odd, one extra agent
+            size[np.arange(rows), self.rng.integers(0,self.number_of_groups,rows)] += 1
+        return size
+        
+class Population():
+    def __init__(self, traits, size, capacity = None, directory = None, chunk = None):
+        """
+        Agents of all groups in one flat array. Group i is traits[offsets[i]:offsets[i+1]].
+        The buffers are kept between generations and only grow when the population does.
+        
+        Parameters
+        ----------
+        traits: trait of every agent, group after group, 0 means Non-Altruistic, 1 means Altruistic
+            (None: buffers are left empty, to be filled chunk by chunk)
+        size: number of agents of each group
+        capacity: agents the buffers can hold, default the number of agents
+        directory: keep the buffers in numpy.memmap files in this directory, default None (in memory).
+            The files are removed at once on POSIX systems, on Windows once the buffers are dropped
+        chunk: the phases work on consecutive groups of at most this many agents at a time
+            (at least one group), so their scratch arrays do not grow with the population, 
+            default None (CHUNK agents)
+        """
+        self.offsets = np.concatenate(([0], np.cumsum(size, dtype=np.int64)))
+        self.number_of_agents = int(self.offsets[-1])
+        self.directory = directory
+        self.chunk = CHUNK if chunk is None else chunk
+        self.files = 0 #memmap files made so far, to name the next ones
+        capacity = max(self.number_of_agents, 0 if capacity is None else capacity)
+        self.traits = self.Buffer(capacity, np.uint8) #trait of every agent
+        self.spare = self.Buffer(capacity, np.uint8) #double buffer of traits
+        self.payoff = self.Buffer(capacity, np.float64) #payoff of every agent
+        if traits is not None:
+            self.traits[:self.number_of_agents] = np.asarray(traits, dtype=np.uint8)
+        
+    @classmethod
+    def FromGroups(cls, groups):
+        """
+        Population from a list of groups of agents
+        
+        Returns
+        -------
+        Population
+        """
+        size = [len(group) for group in groups]
+        return cls(np.concatenate([np.asarray(group, dtype=np.uint8) for group in groups] + [np.empty(0, dtype=np.uint8)]), size)
+    
+    def Buffer(self, capacity, dtype):
+        """
+        A zeroed buffer of capacity items, in memory or in a new memmap file
+        
+        Returns
+        -------
+        array
+        """
+        if self.directory is None:
+            return np.zeros(capacity, dtype=dtype)
+        self.files += 1
+        path = os.path.join(self.directory, "population-{}-{}.bin".format(os.getpid(), self.files))
+        buffer = np.memmap(path, dtype=dtype, mode="w+", shape=(max(capacity, 1),))
+        try:
+            os.unlink(path) #the mapping keeps the file alive until the buffer is dropped
+        except PermissionError: #Windows does not remove a mapped file: remove it once the buffer is dropped, or at exit
+            weakref.finalize(buffer, _RemoveFile, path)
+        return buffer
+    
+    def __len__(self):
+        return len(self.offsets) - 1
+    
+    def __getitem__(self, i):
+        return self.traits[self.offsets[i]:self.offsets[i+1]]
+    
+    def Groups(self):
+        """
+        Returns
+        -------
+        list of groups of agents (views of the population)
+        """
+        return [self[i] for i in range(len(self))]
+    
+    def Chunks(self):
+        """
+        Split the groups in runs of consecutive groups of at most chunk agents
+        
+        Returns
+        -------
+        generator of (first group, end group)
+        """
+        number_of_groups = len(self)
+        first = 0
+        while first < number_of_groups:
+            end = np.searchsorted(self.offsets, self.offsets[first] + self.chunk, side="right") - 1
+            end = int(min(max(end, first + 1), number_of_groups))
+            yield first, end
+            first = end
+    
+    def Size(self):
+        """
+        Returns
+        -------
+        number of agents of each group, array
+        """
+        return np.diff(self.offsets)
+    
+    def Altruists(self):
+        """
+        Returns
+        -------
+        number of Altruistic agents of each group, array
+        """
+        altruists = np.zeros(len(self), dtype=np.int64)
+        for first, end in self.Chunks():
+            offsets = self.offsets[first:end+1]
+            altruists[first:end] = _SegmentSum(self.traits[offsets[0]:offsets[-1]] & 1, offsets - offsets[0])
+        return altruists
+    
+    def GroupIndex(self, first = 0, end = None):
+        """
+        Parameters
+        ----------
+        first, end: range of groups, default all groups
+        
+        Returns
+        -------
+        index of the group of every agent of the range, counted from first, array
+        """
+        end = len(self) if end is None else end
+        return np.repeat(np.arange(end - first, dtype=np.int64), self.Size()[first:end])
+    
+    def Swap(self):
+        """
+        The spare buffer becomes the traits, after a phase wrote the new traits in it
+        """
+        self.traits, self.spare = self.spare, self.traits
+        
+    def Reserve(self, capacity):
+        """
+        Grow the buffers to hold at least capacity agents
+        """
+        if capacity <= len(self.traits):
+            return
+        capacity = max(capacity, len(self.traits) * 3 // 2)
+        traits = self.Buffer(capacity, np.uint8)
+        for first, end in self.Chunks():
+            traits[self.offsets[first]:self.offsets[end]] = self.traits[self.offsets[first]:self.offsets[end]]
+        self.traits = traits
+        self.spare = self.Buffer(capacity, np.uint8)
+        self.payoff = self.Buffer(capacity, np.float64)
+    
+    def Leave(self, groups):
+        """
+        Flag every agent of the given groups as leaving (trait + LEAVING), see Regroup
+        
+        Parameters
+        ----------
+        groups: True for the groups to empty, boolean array
+        """
+        for first, end in self.Chunks():
+            traits = self.traits[self.offsets[first]:self.offsets[end]]
+            traits[groups[first:end][self.GroupIndex(first, end)]] += LEAVING
+    
+    def Regroup(self, ones, zeros):
+        """
+        Agents flagged as leaving (trait + LEAVING) are dropped. New group i is its 
+        remaining agents, in order, followed by ones[i] Altruistic and zeros[i] 
+        Non-Altruistic agents. The order inside a group does not matter,
+        every round starts by shuffling the groups.
+        
+        Parameters
+        ----------
+        ones, zeros: Altruistic and Non-Altruistic agents added to each group, arrays
+        """
+        kept = np.zeros(len(self), dtype=np.int64)
+        for first, end in self.Chunks():
+            offsets = self.offsets[first:end+1]
+            kept[first:end] = _SegmentSum(self.traits[offsets[0]:offsets[-1]] < LEAVING, offsets - offsets[0])
+        offsets = np.concatenate(([0], np.cumsum(kept + ones + zeros, dtype=np.int64)))
+        self.Reserve(int(offsets[-1]))
+        
+        for first, end in self.Chunks():
+            traits = self.traits[self.offsets[first]:self.offsets[end]]
+            kept_traits = traits[traits < LEAVING]
+            kept_offsets = np.concatenate(([0], np.cumsum(kept[first:end])))
+            new_offsets = offsets[first:end+1] - offsets[first]
+            new = self.spare[offsets[first]:offsets[end]]
+            new[:] = 0
+            shift = np.repeat(new_offsets[:-1] - kept_offsets[:-1], kept[first:end])
+            new[np.arange(len(kept_traits)) + shift] = kept_traits
+            first_one = new_offsets[:-1] + kept[first:end] #added Altruistic agents follow the kept ones
+            ones_offsets = np.concatenate(([0], np.cumsum(ones[first:end], dtype=np.int64)))
+            new[np.arange(ones_offsets[-1]) + np.repeat(first_one - ones_offsets[:-1], ones[first:end])] = 1
+        
+        self.Swap()
+        self.offsets = offsets
+        self.number_of_agents = int(offsets[-1])
+        
 class Evolution():
     
-    def __init__(self, list_of_groups, baseline_value = 10, b = 2, c = 1, e = 0.001, m = 0.2):
+    def __init__(self, list_of_groups, baseline_value = 10, b = 2, c = 1, e = 0.001, m = 0.2,
+                 selection = "searchsorted", rng = None):
         """
         evaluate the evolution of agents over time
         
         Paramerers
         ----------
-        list_of_groups: list of groups under evolution. Will be modified by mutation and migration
+        list_of_groups: Population, or list of groups under evolution. Will be modified by mutation and migration
         baseline_value: default value 10
         b: benefit, default value 2
         c: cost, default value 1
         e: mutation rate, default value 0.001
         m: migration rate, default value 0.2
+        selection: how the roulette wheel is spun, default value "searchsorted"
+            "searchsorted": cumulative payoff and binary search of uniform draws, all groups at once
+            "multinomial": one multinomial draw over the payoffs of each group
+            "alias": alias table over the payoff classes of each group, for very large groups
+        rng: numpy random Generator, default a new unseeded one
         
         """
+        if selection not in ("multinomial", "searchsorted", "alias"):
+            raise ValueError("unknown selection method {}".format(selection))
         self.list_of_groups = list_of_groups #agent groups under evolution
-        self.size = [] #each groups size
-        self.agents_will_play = [] #those agents will play PD game
-        self.agents_not_play = [] #those agents will not play PD game in one round
-        self.paired_agents = [] #agents pair randomly to play PD game with
-        self.Groups_payoff = [] #agent groups payoff
-        self.Group_of_Agents = [] #agent groups after calculating payoff
+        if isinstance(list_of_groups, Population):
+            self.population = list_of_groups
+        else:
+            self.population = Population.FromGroups(list_of_groups)
+        self.size = None #each groups size
+        self.players = None #agents of each group that play PD game, one will not play in odd groups
         self.baseline_value = baseline_value #need to calculate payoff from PD game
         self.b = b #benefit of PD game
         self.c = c #cost of PD game
-        self.parent_pool = [] #from this, will get new generation
         self.e = e #new generation will change trait with this probability, causes mutation
-        self.after_mutation = [] #agent groups complete mutation, will under migration
         self.m = m #agents migrate to another group with this probability
+        self.selection = selection #roulette wheel method
+        self.rng = np.random.default_rng() if rng is None else rng
+        #payoff_table[own trait][partner trait], 0 means Non-Altruistic, 1 means Altruistic
+        self.payoff_table = np.array([[self.baseline_value, self.baseline_value + self.b],
+                                      [self.baseline_value - self.c, self.baseline_value + (self.b-self.c)]])
     
     
     def GroupsLength(self):
@@ -103,60 +584,41 @@ class Evolution():
         -------
         None
         """        
-        for i in range(len(self.list_of_groups)):
-            self.size.append(len(self.list_of_groups[i]))
+        self.size = self.population.Size()
     
     def Those_agents_play(self):
         """
-        Determine which agent will play or not play in one round, by their size
+        Determine which agent will play or not play in one round, by their size.
+        The groups are shuffled at once (sorting the group index plus a random fraction), 
+        if the size is odd the last agent of the shuffled group will not play in this round.
         
         Returns
         -------
         None
         """
-    
-        for i in range(len(self.size)):
-            if (self.size[i] % 2) == 0:
-                #print("All agents will play from group {}".format(i))
-                group = self.list_of_groups[i].copy()
-                self.agents_will_play.append(group)
-                self.agents_not_play.append([])
-            
-            else:
-                #print("One agent will not play from group {}".format(i))
-                group = self.list_of_groups[i].copy()
-                index = np.random.randint(len(group))
-                agent = [group.pop(index)]  #select a random agent, not to play in one round
-                self.agents_will_play.append(group)
-                self.agents_not_play.append(agent)
+        population = self.population
+        for first, end in population.Chunks():
+            start, stop = population.offsets[first], population.offsets[end]
+            order = np.argsort(population.GroupIndex(first, end) + self.rng.random(stop - start))
+            np.take(population.traits[start:stop], order, out=population.spare[start:stop])
+        population.Swap()
+        self.players = self.size - (self.size % 2) #odd group, one random agent will not play
                 
     def Getting_group_partner(self):
         """
-        Agent pair randomly with another agents in own group
+        Agent pair randomly with another agents in own group.
+        Players are already shuffled, so consecutive agents are paired
+        and Payoff finds the partner of an agent from its position.
         
         Returns
         -------
         None
         """
-        for group in range(len(self.agents_will_play)):
-            pair_agents = []
-            bb = self.agents_will_play[group].copy()
-            r = len(bb)//2
-            for j in range(r):
-                for i in range(1): #get two random agent from group
-                    pairing = []
-                    a = np.random.choice(bb) 
-                    pairing.append(a)
-                    bb.remove(a)
-                    b = np.random.choice(bb)
-                    pairing.append(b)
-                    bb.remove(b)
-                    pair_agents.append(pairing)
-            self.paired_agents.append(pair_agents)
             
     def Payoff(self): 
         """
-        Calculate the payoff for each agent in groups.
+        Calculate the payoff for each agent in groups, by looking up both agents
+        of every pair in the payoff table. Non player agents get the baseline value.
 
         Row's payoff: [b-c,-c],[b,0]
         Column's Payoff: [b-c,b],[-c,0]
@@ -166,147 +628,206 @@ class Evolution():
         None
     
         """
-    
-        for i in range(len(self.paired_agents)):
-            agents = []
-            payoff = []
-            group = self.paired_agents[i]
-            for j in range(len(group)):
-                sub_group = group[j] #paired agents
-                agent_1 = sub_group[0]
-                agent_2 = sub_group[1]
-                agents.append(agent_1)
-                agents.append(agent_2)
-                if agent_1 == 1 and agent_2 == 1: #both agent Altruistic
-                    agent_1_payoff = self.baseline_value + (self.b-self.c)
-                    agent_2_payoff = self.baseline_value + (self.b-self.c)
-                    payoff.append(agent_1_payoff)
-                    payoff.append(agent_2_payoff)
-                
-    
-                elif agent_1 == 1 and agent_2 == 0:  #agent_1 Altruistic but not agent_2
-                    agent_1_payoff = self.baseline_value + (-self.c)
-                    agent_2_payoff = self.baseline_value + (self.b)
-                    payoff.append(agent_1_payoff)
-                    payoff.append(agent_2_payoff)
-            
-                elif agent_1 == 0 and agent_2 == 1:  #agent_2 Altruistic but not agent_1
-                    agent_1_payoff = self.baseline_value + (self.b)
-                    agent_2_payoff = self.baseline_value + (-self.c)
-                    payoff.append(agent_1_payoff)
-                    payoff.append(agent_2_payoff)
-            
-                elif agent_1 == 0 and agent_2 == 0: #both agent Non-Altruistic
-                    agent_1_payoff = self.baseline_value + (0)
-                    agent_2_payoff = self.baseline_value + (0)
-                    payoff.append(agent_1_payoff)
-                    payoff.append(agent_2_payoff)
-            
-                else:
-                    print("Something is wrong!")
-            self.Groups_payoff.append(payoff)
-            self.Group_of_Agents.append(agents)
+        population = self.population
+        for first, end in population.Chunks():
+            start, stop = population.offsets[first], population.offsets[end]
+            traits = population.traits[start:stop]
+            payoff = population.payoff[start:stop]
+            group_index = population.GroupIndex(first, end)
+            agent = np.arange(stop - start)
+            position = agent - (population.offsets[first:end] - start)[group_index] #position inside own group
+            playing = position < self.players[first:end][group_index]
+            partner = agent + 1 - 2*(position % 2)
+            payoff[:] = self.baseline_value #non player payoff
+            payoff[playing] = self.payoff_table[traits[playing], traits[partner[playing]]]
             
     def NonPlayerPayoff(self):
         """
-        Add non player agent's and payoff's to the respective groups
+        Non player agent's payoff's are already set by Payoff, 
+        kept so the evolution steps stay the same
         
         Returns
         -------
-        None
+        payoff of every agent, array
         """    
-        for i in range(len(self.agents_not_play)):
-            g = self.agents_not_play[i]
-            for j in range(len(g)):
-                self.Group_of_Agents[i].append(g[j]) #add non-player agent at the end of group
-                self.Groups_payoff[i].append(self.baseline_value) #add non player payoff at the end of group
-        return self.Groups_payoff
+        return self.population.payoff[:self.population.number_of_agents]
                 
     def Fitness_determination(self):
         """
         Formulate a parent pool by spinning roulette wheel. The probability that 
         an agent is selected for the parent pool is  equal 
-        to the agents relative payoff compared to the total payoff of the group
+        to the agents relative payoff compared to the total payoff of the group.
+        The whole parent pool of a group is drawn in one call.
         
         Returns
         -------
         None
         """
-        for i in range(len(self.Group_of_Agents)):
-            group = self.Group_of_Agents[i]
-            payoff = self.Groups_payoff[i]
-            groups_total_payoff = sum(payoff)
+        population = self.population
+        for first, end in population.Chunks():
+            start, stop = population.offsets[first], population.offsets[end]
+            traits = population.traits[start:stop]
+            payoff = population.payoff[start:stop]
+            pool = population.spare[start:stop]
+            offsets = population.offsets[first:end+1] - start
             
-            probability  = [] #to be in parent pool (agents)
-    
-            for j in range(len(group)):
-                probability.append(payoff[j]/groups_total_payoff)
-    
-            pool = [] #agents select for parent pool
-            for k in range(len(group)):
-                pool.append(np.random.choice(group, p=probability))
-            self.parent_pool.append(pool)
+            if self.selection == "searchsorted": #one wheel for all groups, each group spins inside its own part
+                group_index = population.GroupIndex(first, end)
+                wheel = np.cumsum(payoff)
+                edge = np.concatenate(([0.0], wheel))[offsets]
+                spin = edge[:-1][group_index] + self.rng.random(stop - start) * np.diff(edge)[group_index]
+                spin.sort() #stays group after group, and sorted spins search much faster
+                selected = np.searchsorted(wheel, spin, side="right")
+                selected = np.clip(selected, offsets[:-1][group_index], offsets[1:][group_index] - 1)
+                np.take(traits, selected, out=pool)
+                continue
             
+            for i in range(end - first):
+                group = traits[offsets[i]:offsets[i+1]]
+                group_payoff = payoff[offsets[i]:offsets[i+1]]
+                if len(group) == 0:
+                    continue
+                if self.selection == "multinomial":
+                    copies = self.rng.multinomial(len(group), group_payoff / group_payoff.sum()) #times each agent is selected
+                    pool[offsets[i]:offsets[i+1]] = np.repeat(group, copies)
+                else:
+                    #few distinct payoffs, so the table is built over payoff classes
+                    values, classes, class_size = np.unique(group_payoff, return_inverse=True, return_counts=True)
+                    table = AliasTable(values * class_size)
+                    chosen_class = table.Draw(len(group), self.rng)
+                    members = np.argsort(classes, kind="stable") #agent index sorted by class
+                    first_member = np.cumsum(class_size) - class_size
+                    offset = (self.rng.random(len(group)) * class_size[chosen_class]).astype(np.int64)
+                    pool[offsets[i]:offsets[i+1]] = group[members[first_member[chosen_class] + offset]]
+        population.Swap()
+        
     def Mutation(self):
         """
         With probability e an agent randomly determines his trait. 
         Therefore the probability of one agent switching type is e /2.
+        The mutants are found by geometric skip sampling over the whole
+        population, so the cost follows the number of mutations.
         
         Returns
         -------
         None
         """
-
-        d = 1-self.e #probability of one agent not switching type
-
-        for i in range(len(self.parent_pool)):
-            under_mutation = self.parent_pool[i]
-            agents_done = []
-            for j in range(len(under_mutation)):
-                agent = under_mutation[j]
-                choice = np.random.choice([True, False], p = [self.e, d])
-                if choice == False:
-                    agents_done.append(agent)
-                else:
-                    choose = np.random.choice([1,0], p=[0.5,0.5])
-                    agents_done.append(choose)
-                    
-            self.after_mutation.append(agents_done)
+        mutants = self.MutantIndex(self.population.number_of_agents)
+        self.population.traits[mutants] = self.rng.integers(0, 2, len(mutants)) #randomly determines the trait
+    
+    def CompiledGeneration(self):
+        """
+        All the steps from Those_agents_play to Migration in one compiled kernel 
+        (numba backend), see _GenerationKernel. The migrants are then counted by destination
+        chunk by chunk, from the payoff buffer, so nothing the size of the population is allocated.
+        
+        Returns
+        -------
+        self.population: agent groups after migration, Population
+        """
+        population = self.population
+        n = population.number_of_agents
+        seeds = self.rng.integers(0, 2**32, len(population), dtype=np.int64) #a random stream per group
+        _CompiledKernel()(population.traits[:n], population.spare[:n], population.payoff[:n], population.offsets,
+                          self.payoff_table, float(self.baseline_value), float(self.e), float(self.m), seeds)
+        population.Swap()
+        
+        number_of_groups = len(population)
+        ones = np.zeros(number_of_groups, dtype=np.int64)
+        zeros = np.zeros(number_of_groups, dtype=np.int64)
+        for first, end in population.Chunks():
+            start, stop = population.offsets[first], population.offsets[end]
+            destination = population.payoff[start:stop]
+            migrant = destination >= 0
+            altruist = (population.traits[start:stop] & 1)[migrant] == 1
+            destination = destination[migrant].astype(np.int64)
+            ones += np.bincount(destination[altruist], minlength=number_of_groups)
+            zeros += np.bincount(destination[~altruist], minlength=number_of_groups)
+        population.Regroup(ones, zeros)
+        return population
+    
+    def MutantIndex(self, n):
+        """
+        Index of the agents that mutate among n agents, each one with probability e.
+        The gaps between two mutants are geometric.
+        
+        Returns
+        -------
+        sorted index of mutants, array
+        """
+        if self.e <= 0 or n == 0:
+            return np.empty(0, dtype=np.int64)
+        expected = n * self.e
+        gaps = self.rng.geometric(self.e, int(expected + 5 * np.sqrt(expected)) + 10)
+        index = np.cumsum(gaps) - 1
+        while index[-1] < n: #rare, draw more gaps
+            gaps = self.rng.geometric(self.e, len(gaps))
+            index = np.concatenate((index, index[-1] + np.cumsum(gaps)))
+        return index[index < n]
             
     def Migration(self):
         """
         Every member of the population has equal probability, 
-        to migrate to another group which is randomly selected among all the groups except its own
+        to migrate to another group which is randomly selected among all the groups except its own.
+        The destination is the own group plus a random offset (1 to number of groups - 1),
+        migrants are flagged as leaving and added to their destination by trait in one regroup.
         
         Returns
         -------
-        self.after_mutation: agent groups after migration, list
+        self.population: agent groups after migration, Population
         """
-        w = 1 - self.m
-        
-        groups_index = [i for i in range(len(self.after_mutation))]
-        migrated_agent = []
+        population = self.population
+        if len(population) < 2: #no other group to migrate to
+            return population
+        ones, zeros = self.Emigrants(len(population))
+        population.Regroup(ones, zeros)
+        return population
+    
+    def Emigrants(self, number_of_groups, first_group = 0):
+        """
+        Draw the migrants, flag them as leaving, and count them by destination and trait.
+        The population may be a part of all the groups (an island), starting at first_group.
         
-        for j in range(len(self.after_mutation)):
-            group = self.after_mutation[j]
-            agent_migrating = []
-            for agent in group:
-                migration = np.random.choice([True, False], p = [self.m, w])
-                if migration == True:
-                    agent_migrating.append(agent)
-                else:
-                    pass
-            migrated_agent.append(agent_migrating)
+        Returns
+        -------
+        ones, zeros: Altruistic and Non-Altruistic migrants going to each of all the groups, arrays
+        """
+        population = self.population
+        ones = np.zeros(number_of_groups, dtype=np.int64)
+        zeros = np.zeros(number_of_groups, dtype=np.int64)
+        if number_of_groups < 2:
+            return ones, zeros
+        for first, end in population.Chunks():
+            start, stop = population.offsets[first], population.offsets[end]
+            traits = population.traits[start:stop]
+            migrant = self.rng.random(stop - start) < self.m
+            source = population.GroupIndex(first, end)[migrant] + first + first_group
+            destination = (source + self.rng.integers(1, number_of_groups, len(source))) % number_of_groups
+            altruist = traits[migrant] == 1
+            ones += np.bincount(destination[altruist], minlength=number_of_groups)
+            zeros += np.bincount(destination[~altruist], minlength=number_of_groups)
+            traits[migrant] += LEAVING
+        return ones, zeros
+    
+    def GroupsStrength(self, groups = None):
+        """
+        Mean payoff of each group, the strength of the group in a war.
+        Drawn in closed form from the number of altruists, see _GroupStrength.
         
-        for j in range(len(self.after_mutation)):
-            remain_groups_index = groups_index.copy()
-            remain_groups_index.remove(j)
+        Parameters
+        ----------
+        groups: agent groups, default the population
         
-            for agent in migrated_agent[j]:
-                index = np.random.choice(remain_groups_index)
-                self.after_mutation[index].append(agent)
-                self.after_mutation[j].remove(agent)
-        return self.after_mutation
+        Returns
+        -------
+        mean payoff of each group, array (empty group: -inf)
+        """
+        if groups is None:
+            altruists, size = self.population.Altruists(), self.population.Size()
+        else:
+            size = np.array([len(group) for group in groups], dtype=np.int64)
+            altruists = np.array([np.count_nonzero(np.asarray(group) == 1) for group in groups], dtype=np.int64)
+        return _GroupStrength(self.rng, altruists, size, self.baseline_value, self.b, self.c)
     
     def Check(self):
         """
@@ -317,131 +838,105 @@ class Evolution():
         ------
         None
         """
-        print("group list is:", self.list_of_groups)
+        print("group list is:", self.population.Groups())
         print("groups size:", self.size)
-        print("Agents will play:", self.agents_will_play)
-        print("Agents will not play:", self.agents_not_play)
-        print("Paired agents:", self.paired_agents)
+        print("Agents will play:", self.players)
         print("Baseline {}, benefit {}, cost {}".format(self.baseline_value, self.b, self.c))
-        print("Groups of agents:", self.Group_of_Agents)
-        print("Groups resrective payoff:", self.Groups_payoff)
-        #print("Update agent Groups:", self.Group_of_Agents)
-        #print("Update payoff's:", self.Groups_payoff)
-        print("New generations:", self.parent_pool)
-        #print("After mutation:", self.after_mutation)
-        print("After migration:", self.after_mutation)
+        print("Agents payoff:", self.NonPlayerPayoff())
     
 class War():
-    def __init__(self,after_migration,k = 0.25):
+    def __init__(self,after_migration,k = 0.25, strength = None, rng = None):
         """
         Determine winning and losing groups of agents after joining a war
         
         Parameters
         ----------
-        after_migration: group of agents after migration
+        after_migration: Population, or group of agents after migration
         k : probability of joing a war, default value 0.25
+        strength: mean payoff of each group (Evolution.GroupsStrength), 
+            default computed with the default game values
+        rng: numpy random Generator, default a new unseeded one
         """
-        self.after_migration = after_migration.copy()
+        if isinstance(after_migration, Population):
+            self.after_migration = after_migration
+        else:
+            self.after_migration = Population.FromGroups(after_migration)
         self.k = k
-        self.will_compete_index = []
-        self.war_paired = []
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.strength = Evolution(self.after_migration, rng=self.rng).GroupsStrength() if strength is None else np.asarray(strength)
+        self.will_compete_index = np.empty(0, dtype=np.int64)
+        self.war_paired = np.empty((0, 2), dtype=np.int64)
+        self.fought = np.empty((0, 2), dtype=np.int64) #pairs of the last conflict
+        self.winners = np.empty(0, dtype=np.int64) #winner of each pair of the last conflict
         
     def Compete(self):
         """
-        Will find interested groups index of war
+        Will find interested groups index of war.
+        If an odd number of groups is interested, one more group is drafted at random.
         
         return 
         ------
         None
         """
-        m = 1-self.k
-        all_groups_index = [i for i in range(len(self.after_migration))]
+        number_of_groups = len(self.after_migration)
+        compete = self.rng.random(number_of_groups) < self.k
         
-        for i in all_groups_index:
-            compete = np.random.choice([True, False], p = [self.k, m])
-            if compete == False:
-                pass
-            else:
-                self.will_compete_index.append(i)
-                
-        for j in self.will_compete_index:
-            all_groups_index.remove(j)
-            
-        if (len(self.will_compete_index) % 2) != 0:
-            index = np.random.choice(all_groups_index)
-            self.will_compete_index.append(index)
-            all_groups_index.remove(index)
-        else:
-            pass
-        all_groups_index.clear()
+        if np.count_nonzero(compete) % 2 != 0:
+            not_compete = np.flatnonzero(~compete)
+            if len(not_compete) > 0:
+                compete[not_compete[self.rng.integers(len(not_compete))]] = True
+            else: #every group is interested, one of them sits out
+                compete[self.rng.integers(number_of_groups)] = False
+        self.will_compete_index = np.flatnonzero(compete)
         
     def CompetePartner(self):
         """
-        pair group indexes for compete
+        pair group indexes for compete, by one random permutation
         
         return
         ------
         None
         """
-        r = len(self.will_compete_index) // 2
-        for i in range(r):
-            pairing  = []
-            for j in range(1):
-                choose = np.random.choice(self.will_compete_index)
-                pairing.append(choose)
-                self.will_compete_index.remove(choose)
-                choose = np.random.choice(self.will_compete_index)
-                pairing.append(choose)
-                self.will_compete_index.remove(choose)
-
-            self.war_paired.append(pairing)
-        self.will_compete_index.clear()
+        self.war_paired = self.rng.permutation(self.will_compete_index).reshape(-1, 2)
+        self.will_compete_index = np.empty(0, dtype=np.int64)
         
-    
     def GroupsConflicts(self):
         """
-        Calculate the total payoff of the groups, and compare them. 
+        Compare the mean payoff (strength) of the paired groups. 
         In war, in between two groups, the group with highest relative payoff will be the winner.
-        The loser groups agents will be replaced by winner groups agents.
+        The loser groups agents will be replaced by winner groups agents: the winner's agents are
+        doubled and each copy goes to one of the two groups at random, so the first group gets a
+        binomial number of them, and a hypergeometric number of the Altruistic ones.
         
         return
         ------
-        groups of agents after war: list
-        """
-        for i in range(len(self.war_paired)):
-            compete_groups_index = self.war_paired[i]
-            group_1_index = compete_groups_index[0]
-            group_2_index = compete_groups_index[1]
-            group_1 = self.after_migration[group_1_index].copy()
-            group_2 = self.after_migration[group_2_index].copy()
-            compete_groups = [group_1, group_2]
-            game = Evolution(compete_groups) #use evolution class to calculate payoff
-            game.GroupsLength()
-            game.Those_agents_play()
-            game.Getting_group_partner()
-            game.Payoff()
-            update_compete_payoff = game.NonPlayerPayoff()
-            
-            group_1_total_payoff = sum(update_compete_payoff[0]) / len(group_1)
-            group_2_total_payoff = sum(update_compete_payoff[1]) / len(group_2)
-            
-            merge_winner_agents = []
-            if group_1_total_payoff > group_2_total_payoff:
-                for i in range(2):
-                    for j in range(len(group_1)):
-                        merge_winner_agents.append(group_1[j])
-            else:
-                for i in range(2):
-                    for j in range(len(group_2)):
-                        merge_winner_agents.append(group_2[j])
-            self.after_migration[group_1_index].clear()
-            self.after_migration[group_2_index].clear()
-            for i in range(len(merge_winner_agents)):
-                agent = merge_winner_agents[i]
-                random_selection = np.random.choice(compete_groups_index)
-                self.after_migration[random_selection].append(agent)
-        self.war_paired.clear()
-        return self.after_migration
+        groups of agents after war: Population
+        """
+        population = self.after_migration
+        if len(self.war_paired) == 0:
+            return population
+        
+        mean_payoff = self.strength[self.war_paired]
+        #group 2 wins ties
+        winner = np.where(mean_payoff[:, 0] > mean_payoff[:, 1], self.war_paired[:, 0], self.war_paired[:, 1])
+        winner_a = 2 * population.Altruists()[winner]
+        winner_size = 2 * population.Size()[winner]
+        first_size = self.rng.binomial(winner_size, 0.5) #winner's agents going to the first group
+        first_a = _Hypergeometric(self.rng, winner_a, winner_size - winner_a, first_size)
+        
+        ones = np.zeros(len(population), dtype=np.int64)
+        zeros = np.zeros(len(population), dtype=np.int64)
+        ones[self.war_paired[:, 0]] = first_a
+        zeros[self.war_paired[:, 0]] = first_size - first_a
+        ones[self.war_paired[:, 1]] = winner_a - first_a
+        zeros[self.war_paired[:, 1]] = (winner_size - first_size) - (winner_a - first_a)
+        at_war = np.zeros(len(population), dtype=bool)
+        at_war[self.war_paired.ravel()] = True
+        population.Leave(at_war)
+        population.Regroup(ones, zeros)
+        self.fought, self.winners = self.war_paired, winner
+        self.war_paired = np.empty((0, 2), dtype=np.int64)
+        return population
     
     def WCheck(self):
         """
@@ -453,130 +948,2081 @@ class War():
         """
         print("Grpups indexes join wars, end of time:", self.will_compete_index)
         print("War partner, before the end of time:", self.war_paired)
-        print("After war:", self.after_migration)
+        print("After war:", self.after_migration.Groups())
         
-class Simulation():
+class Composition():
     
-    def __init__(self,total_group,total_agent,t,conflict = False):
+    def __init__(self, altruists, size, baseline_value = 10, b = 2, c = 1, e = 0.001, m = 0.2,
+                 exact_migration = 128, rng = None):
         """
-        Set values
+        Evolution and war of groups kept only as counts. Agents carry only a trait,
+        so a group is fully described by its number of Altruistic agents and its size,
+        and one generation costs O(number of groups) whatever the population size.
+        The first axis holds independent populations (replicates), the second the groups.
         
         Parameters
         ----------
-        total_group: total groups under evolution, int
-        total_agent: total agent under evolution, int
-        t: time, how much time the simulation will run
-        conflict: war exist or not, default value False
+        altruists: number of Altruistic agents of each group, array
+        size: number of agents of each group, array
+        baseline_value, b, c, e, m: see Evolution
+        exact_migration: up to this many groups migrants are sent exactly like Evolution.Migration,
+            at a cost of the smaller of migrants and groups^2 per generation; above it the migrants 
+            are pooled, which keeps the expected flows at a cost of O(groups), default value 128
+        rng: numpy random Generator, default a new unseeded one
         
         """
-        self.t = t #time
-        self.conflict = conflict #groups war
-        self.total_group = total_group
-        self.total_agent = total_agent
-        self.agent_groups = GroupOfAgent(self.total_group,self.total_agent).Setup() #modefied over time
-        self.Number_of_Altruists = []
-        self.Number_of_NonAltruists = []
-    
-    def Run(self):
-        if self.conflict == False: #without war
-            for time in range(self.t):
-                count_a = []
-                count_n = []
-                process = Evolution(self.agent_groups) #use Evolution class
-                process.GroupsLength()
-                process.Those_agents_play()
-                process.Getting_group_partner()
-                process.Payoff()
-                process.NonPlayerPayoff()
-                process.Fitness_determination()
-                process.Mutation()
-                after_mig = process.Migration() #agents after migration
-                
-                self.agent_groups.clear()
-                
-                for i in range(len(after_mig)):
-                    count_a.append(after_mig[i].count(1))
-                    count_n.append(after_mig[i].count(0))
-                    self.agent_groups.append(after_mig[i])
-                self.Number_of_Altruists.append(sum(count_a))
-                self.Number_of_NonAltruists.append(sum(count_n))
-        else:
-            for time in range(self.t):
-                count_a = []
-                count_n = []
-                process = Evolution(self.agent_groups) #use evolution class
-                process.GroupsLength()
-                process.Those_agents_play()
-                process.Getting_group_partner()
-                process.Payoff()
-                process.NonPlayerPayoff()
-                process.Fitness_determination()
-                process.Mutation()
-                after_mig = process.Migration()
-                    
-                after_war = War(after_mig) #use war class
-                after_war.Compete()
-                after_war.CompetePartner()
-                after_war_agents = after_war.GroupsConflicts()
-                    
-                self.agent_groups.clear()
-                
-                for i in range(len(after_war_agents)):
-                    count_a.append(after_war_agents[i].count(1))
-                    count_n.append(after_war_agents[i].count(0))
-                    self.agent_groups.append(after_war_agents[i])
-                self.Number_of_Altruists.append(sum(count_a))
-                self.Number_of_NonAltruists.append(sum(count_n))
+        self.altruists = np.array(altruists, dtype=np.int64, ndmin=2)
+        self.size = np.array(size, dtype=np.int64, ndmin=2)
+        self.baseline_value = baseline_value
+        self.b = b
+        self.c = c
+        self.e = e
+        self.m = m
+        self.exact_migration = exact_migration
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.altruists_payoff = None #total payoff of Altruistic agents of each group
+        self.nonaltruists_payoff = None #total payoff of Non-Altruistic agents of each group
+        self.wars = np.zeros(len(self.size), dtype=np.int64) #wars fought in the last conflict
+        self.at_war = np.zeros(self.size.shape, dtype=bool) #groups at war in the last conflict
+        self.war_rows = np.empty(0, dtype=np.int64) #replicate of each pair of the last conflict
+        self.war_paired = np.empty((0, 2), dtype=np.int64) #pairs of groups of the last conflict
+        self.winners = np.empty(0, dtype=np.int64) #winner of each pair of the last conflict
         
-    def Plot(self):
+    def Payoff(self):
         """
-        fig-1: plot Number of Altruistic and Number of Non-Altruistic over time, seperately
-        fig-2: plot Number of Altruistic and Non-Altruistic over time, together
-        fig-3: plot Number of Altruistic against Number of Non-Altruistic
-        Both figure saves as image
+        Pair the agents of each group and calculate the total payoff of each trait.
+        The players are pairs (first seat, second seat): the altruists in first seats are
+        hypergeometric, and so are the second seat altruists facing an altruist.
+        In an odd group one random agent does not play and gets the baseline value.
+        
+        Returns
+        -------
+        None
         """
-        fig1, ax = plt.subplots(nrows=2, ncols=1, squeeze=False)
-        ax[0][0].plot(np.arange(self.t),self.Number_of_NonAltruists,c="b", label = "Non-Altruists")
-        ax[1][0].plot(np.arange(self.t),self.Number_of_Altruists, c="g", label = "Altruists" )
-        ax[0][0].set_xlabel("Time")
-        ax[1][0].set_xlabel("Time")
-        ax[0][0].set_ylabel("Number of Non-Altruistic")
-        ax[1][0].set_ylabel("Number of Altruistic")
-        ax[0][0].set_title("Altruistic and Non-Altruistic population over time")
-        ax[0][0].legend()
-        ax[1][0].legend()
-        plt.tight_layout()
-        plt.savefig("Altruistic and Non-Altruistic population over time.png", dpi=300)
+        odd = self.size % 2
+        sit_out = odd * (self.rng.random(self.size.shape) * self.size < self.altruists)
+        players_a = self.altruists - sit_out
+        players = self.size - odd
+        pairs = players // 2
+        first_seat_a = _Hypergeometric(self.rng, players_a, players - players_a, pairs)
+        both_a = _Hypergeometric(self.rng, first_seat_a, pairs - first_seat_a, players_a - first_seat_a) #altruist pairs
+        mixed = players_a - 2*both_a #pairs of one Altruistic and one Non-Altruistic agent
+        both_n = pairs - both_a - mixed
         
-        fig2, ax = plt.subplots(nrows=1, ncols=1, squeeze=False)
-        ax[0][0].plot(np.arange(self.t),self.Number_of_NonAltruists,c="b", label = "Non-Altruists")
-        ax[0][0].plot(np.arange(self.t),self.Number_of_Altruists, c="g", label = "Altruists" )
-        ax[0][0].set_xlabel("Time")
-        ax[0][0].set_ylabel("Altruistic and Non-Altruistic population")
-        ax[0][0].set_title("Altruistic and Non-Altruistic population over time")
-        ax[0][0].legend()
-        plt.tight_layout()
-        plt.savefig("Altruistic and Non-Altruistic population over time (together).png", dpi=300)
+        self.altruists_payoff = (2*both_a*(self.baseline_value + (self.b-self.c)) + mixed*(self.baseline_value - self.c) 
+                                 + sit_out*self.baseline_value)
+        self.nonaltruists_payoff = (mixed*(self.baseline_value + self.b) + 2*both_n*self.baseline_value 
+                                    + (odd - sit_out)*self.baseline_value)
         
-        fig3, ax = plt.subplots(nrows=1, ncols=1, squeeze=False)
-        ax[0][0].plot(self.Number_of_NonAltruists,self.Number_of_Altruists)
-        ax[0][0].set_xlabel("Number of Non-Altruistic")
-        ax[0][0].set_ylabel("Number of Altruistic")
-        ax[0][0].set_title("Altruistic population against  Non-Altruistic population")
-        plt.tight_layout()
-        plt.savefig("Change of Altruistic against Non-Altruistic.png", dpi=300)        
-        plt.show()
-
-
-"""Main script"""
-"""set, group = 20, total agent = 400, time = 100, war = False """
-if __name__ == '__main__':
-    test_case_1 = Simulation(20,400,100) #without war
+    def Fitness_determination(self):
+        """
+        Spin the roulette wheel for the whole parent pool. The multinomial over the 
+        payoff classes only matters through the trait, so the number of Altruistic 
+        parents is binomial with the Altruistic share of the group payoff.
+        
+        Returns
+        -------
+        None
+        """
+        total = self.altruists_payoff + self.nonaltruists_payoff
+        share = np.divide(self.altruists_payoff, total, out=np.zeros(total.shape), where=total > 0)
+        self.altruists = self.rng.binomial(self.size, share)
+        
+    def Mutation(self):
+        """
+        With probability e an agent randomly determines his trait,
+        so each trait switches with probability e / 2
+        
+        Returns
+        -------
+        None
+        """
+        to_nonaltruist = self.rng.binomial(self.altruists, self.e / 2)
+        to_altruist = self.rng.binomial(self.size - self.altruists, self.e / 2)
+        self.altruists = self.altruists - to_nonaltruist + to_altruist
+        
+    def Migration(self):
+        """
+        Every agent migrates with probability m to another group, 
+        randomly selected among all the groups except its own
+        
+        Returns
+        -------
+        None
+        """
+        if self.size.shape[1] < 2: #no other group to migrate to
+            return
+        out_a = self.rng.binomial(self.altruists, self.m)
+        out_n = self.rng.binomial(self.size - self.altruists, self.m)
+        in_a = self.Destination(out_a)
+        in_n = self.Destination(out_n)
+        self.altruists = self.altruists - out_a + in_a
+        self.size = self.size - out_a - out_n + in_a + in_n
+        
+    def Destination(self, migrants):
+        """
+        Send the migrants of every group to the other groups.
+        Exact: every migrant of group i goes to group i + offset, with an offset drawn 
+        uniformly from 1 .. groups-1. With more migrants than groups^2 the migrants of 
+        each group are split over the offsets by one multinomial instead.
+        Pooled: all migrants are spread by one multinomial, where a group's chance
+        is the share of migrants that did not come from it.
+        
+        Returns
+        -------
+        number of migrants each group receives, array
+        """
+        number_of_groups = migrants.shape[1]
+        if number_of_groups <= self.exact_migration:
+            total = int(migrants.sum())
+            if total <= migrants.size * (number_of_groups - 1):
+                source = np.repeat(np.arange(migrants.size), migrants.ravel())
+                group = source % number_of_groups
+                destination = source - group + (group + self.rng.integers(1, number_of_groups, total)) % number_of_groups
+                return np.bincount(destination, minlength=migrants.size).reshape(migrants.shape)
+            moving = self.rng.multinomial(migrants, np.full(number_of_groups - 1, 1.0 / (number_of_groups - 1)))
+            offset = (np.arange(number_of_groups)[:, None] + np.arange(1, number_of_groups)) % number_of_groups
+            destination = np.arange(len(migrants))[:, None, None] * number_of_groups + offset
+            received = np.bincount(destination.ravel(), weights=moving.ravel(), minlength=migrants.size)
+            received = received.astype(np.int64).reshape(migrants.shape)
+        else:
+            total = migrants.sum(axis=1, keepdims=True)
+            chance = np.divide(total - migrants, total * (number_of_groups - 1), 
+                               out=np.full(migrants.shape, 1.0 / number_of_groups), where=total > 0)
+            received = self.rng.multinomial(total[:, 0], chance / chance.sum(axis=1, keepdims=True))
+        return received
+    
+    def War(self, k = 0.25):
+        """
+        Groups join a war with probability k (one more group is drafted if the number is odd),
+        and are paired by one random permutation. The group with the higher mean payoff wins, 
+        group 2 wins ties. The winner's agents are doubled and split at random between both groups.
+        
+        Returns
+        -------
+        None
+        """
+        replicates, number_of_groups = self.size.shape
+        if number_of_groups < 2:
+            return
+        rows = np.arange(replicates)
+        compete = self.rng.random(self.size.shape) < k
+        key = self.rng.random(self.size.shape)
+        odd = compete.sum(axis=1) % 2 == 1
+        free = (~compete).any(axis=1)
+        draft = np.argmax(np.where(compete, -1.0, key), axis=1)
+        drop = np.argmax(np.where(compete, key, -1.0), axis=1)
+        compete[rows[odd & free], draft[odd & free]] = True
+        compete[rows[odd & ~free], drop[odd & ~free]] = False #every group is interested, one sits out
+        
+        order = np.argsort(np.where(compete, self.rng.random(self.size.shape), 2.0), axis=1)
+        self.wars = compete.sum(axis=1) // 2
+        self.at_war = compete
+        first = order[:, 0:2*(number_of_groups // 2):2]
+        second = order[:, 1:2*(number_of_groups // 2):2]
+        at_war = np.arange(number_of_groups // 2) < self.wars[:, None]
+        row = np.broadcast_to(rows[:, None], first.shape)[at_war]
+        first = first[at_war]
+        second = second[at_war]
+        
+        strength = _GroupStrength(self.rng, self.altruists, self.size, self.baseline_value, self.b, self.c)
+        winner = np.where(strength[row, first] > strength[row, second], first, second)
+        self.war_rows, self.war_paired, self.winners = row, np.stack([first, second], axis=1), winner
+        winner_a = 2*self.altruists[row, winner]
+        winner_size = 2*self.size[row, winner]
+        first_size = self.rng.binomial(winner_size, 0.5)
+        first_a = _Hypergeometric(self.rng, winner_a, winner_size - winner_a, first_size)
+        self.altruists[row, first] = first_a
+        self.size[row, first] = first_size
+        self.altruists[row, second] = winner_a - first_a
+        self.size[row, second] = winner_size - first_size
+    
+    def Check(self):
+        """
+        Print values Just for check.
+        
+        return
+        ------
+        None
+        """
+        print("Altruists of groups:", self.altruists)
+        print("groups size:", self.size)
+        print("Baseline {}, benefit {}, cost {}".format(self.baseline_value, self.b, self.c))
+        print("Altruistic payoff:", self.altruists_payoff)
+        print("Non-Altruistic payoff:", self.nonaltruists_payoff)
+        print("Wars:", self.wars)
+
+class MeanField():
+    
+    def __init__(self, altruists, size, baseline_value = 10, b = 2, c = 1, e = 0.001, m = 0.2):
+        """
+        Expected dynamics of groups kept as counts (floats), for large populations.
+        Each step replaces the random draws of Composition by their mean, so a generation
+        is a few vectorized difference equations over the groups and has no randomness.
+        Same layout as Composition: the first axis holds populations, the second the groups.
+        There is no variance between groups to select on: migration evens the groups out, 
+        and War between groups of the same composition leaves them as they are.
+        
+        Parameters
+        ----------
+        altruists: number of Altruistic agents of each group, array
+        size: number of agents of each group, array
+        baseline_value, b, c, e, m: see Evolution
+        
+        """
+        self.altruists = np.array(altruists, dtype=np.float64, ndmin=2)
+        self.size = np.array(size, dtype=np.float64, ndmin=2)
+        self.baseline_value = baseline_value
+        self.b = b
+        self.c = c
+        self.e = e
+        self.m = m
+        self.altruist_payoff = None #expected payoff of an Altruistic agent of each group
+        self.nonaltruist_payoff = None #expected payoff of a Non-Altruistic agent of each group
+        self.wars = np.zeros(len(self.size)) #expected wars of the last conflict
+        
+    def Payoff(self):
+        """
+        Expected payoff of each trait when the partner is any other agent of the group:
+        Altruistic baseline - c + b (a-1)/(n-1), Non-Altruistic baseline + b a/(n-1).
+        An agent alone in its group gets the baseline value.
+        
+        Returns
+        -------
+        None
+        """
+        others = self.size - 1
+        partners = others > 0
+        altruist_partner = np.divide(self.altruists - 1, others, out=np.zeros(self.size.shape), where=partners)
+        nonaltruist_partner = np.divide(self.altruists, others, out=np.zeros(self.size.shape), where=partners)
+        self.altruist_payoff = self.baseline_value + np.where(partners, self.b * altruist_partner - self.c, 0.0)
+        self.nonaltruist_payoff = self.baseline_value + self.b * nonaltruist_partner
+        
+    def Fitness_determination(self):
+        """
+        Replicator step: the Altruistic share of the parents is their share of the group payoff
+        
+        Returns
+        -------
+        None
+        """
+        altruists_payoff = self.altruists * self.altruist_payoff
+        total = altruists_payoff + (self.size - self.altruists) * self.nonaltruist_payoff
+        self.altruists = self.size * np.divide(altruists_payoff, total, out=np.zeros(total.shape), where=total > 0)
+        
+    def Mutation(self):
+        """
+        The Altruistic share x becomes x (1-e) + e/2
+        
+        Returns
+        -------
+        None
+        """
+        self.altruists = self.altruists * (1 - self.e) + self.size * self.e / 2
+        
+    def Migration(self):
+        """
+        A share m of every group leaves it, and is spread evenly over the other groups
+        
+        Returns
+        -------
+        None
+        """
+        number_of_groups = self.size.shape[1]
+        if number_of_groups < 2: #no other group to migrate to
+            return
+        out_a = self.m * self.altruists
+        out_n = self.m * self.size
+        in_a = (out_a.sum(axis=1, keepdims=True) - out_a) / (number_of_groups - 1)
+        in_n = (out_n.sum(axis=1, keepdims=True) - out_n) / (number_of_groups - 1)
+        self.altruists = self.altruists - out_a + in_a
+        self.size = self.size - out_n + in_n
+        
+    def War(self, k = 0.25):
+        """
+        Expected war: with probability k a group fights one of the other groups, all equally
+        likely, and then takes the composition of the stronger (mean payoff) of the two, 
+        half of each on a tie. The groups are sorted by strength, so the sum over the 
+        possible enemies comes from cumulative sums.
+        
+        Returns
+        -------
+        None
+        """
+        number_of_groups = self.size.shape[1]
+        if number_of_groups < 2:
+            return
+        strength = np.full(self.size.shape, -np.inf)
+        filled = self.size > 0
+        strength[filled] = self.baseline_value + (self.b - self.c) * self.altruists[filled] / self.size[filled]
+        for row in range(len(self.size)):
+            levels, level, tied = np.unique(strength[row], return_inverse=True, return_counts=True)
+            weaker = (np.cumsum(tied) - tied)[level] #groups weaker than each group
+            for state in (self.altruists, self.size):
+                level_total = np.bincount(level, weights=state[row], minlength=len(levels))
+                stronger = state[row].sum() - np.cumsum(level_total)[level] #sum over stronger groups
+                expected = (weaker * state[row] + stronger
+                            + 0.5 * ((tied[level] - 1) * state[row] + level_total[level] - state[row])) / (number_of_groups - 1)
+                state[row] = (1 - k) * state[row] + k * expected
+        self.wars = np.full(len(self.size), k * number_of_groups / 2)
+    
+    def Check(self):
+        """
+        Print values Just for check.
+        
+        return
+        ------
+        None
+        """
+        print("Altruists of groups:", self.altruists)
+        print("groups size:", self.size)
+        print("Baseline {}, benefit {}, cost {}".format(self.baseline_value, self.b, self.c))
+        print("Altruistic payoff:", self.altruist_payoff)
+        print("Non-Altruistic payoff:", self.nonaltruist_payoff)
+
+def _SharedArray(shape, dtype, name = None):
+    """
+    Numpy array in a shared memory block, a new block if name is None
+
+    Returns
+    -------
+    shared memory block, array on it
+    """
+    nbytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+    if name is None:
+        block = shared_memory.SharedMemory(create=True, size=nbytes)
+    else:
+        block = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    if name is None:
+        array[...] = 0
+    return block, array
+
+def _IslandWorker(island, first, size, parameters, seed_sequence, names, shapes, connection, chunk):
+    """
+    Worker process of Islands: evolves the groups first .. first + len(size) - 1 locally.
+    Only migrant and war counts cross the process boundary, through shared memory.
+    Each step is ordered by the main process through the connection and answered
+    when it is done; an error is sent back before the worker stops.
+    
+    Returns
+    -------
+    None
+    """
+    rng = np.random.default_rng(seed_sequence)
+    blocks = {}
+    arrays = {}
+    for key in names:
+        blocks[key], arrays[key] = _SharedArray(shapes[key], np.int64, names[key])
+    outgoing, counts, war = arrays["outgoing"], arrays["counts"], arrays["war"]
+    end = first + len(size)
+    number_of_groups = len(counts)
+    
+    try:
+        population = GroupOfAgent(len(size), int(size.sum()), rng).SetupPopulation(chunk=chunk, size=size)
+        while True:
+            try:
+                step = connection.recv()
+            except EOFError: #the main process is gone
+                break
+            if step == "stop":
+                break
+            if step == "migrants":
+                process = Evolution(population, parameters["baseline_value"], parameters["b"], parameters["c"],
+                                    parameters["e"], parameters["m"], rng=rng)
+                process.GroupsLength()
+                process.Those_agents_play()
+                process.Getting_group_partner()
+                process.Payoff()
+                process.NonPlayerPayoff()
+                process.Fitness_determination()
+                process.Mutation()
+                outgoing[island, :, 0], outgoing[island, :, 1] = process.Emigrants(number_of_groups, first)
+            elif step == "groups":
+                population.Regroup(outgoing[:, first:end, 0].sum(axis=0), outgoing[:, first:end, 1].sum(axis=0))
+                counts[first:end, 0] = population.Altruists()
+                counts[first:end, 1] = population.Size()
+            elif step == "war":
+                at_war = war[first:end, 0] > 0
+                if at_war.any():
+                    population.Leave(at_war)
+                    population.Regroup(np.where(at_war, war[first:end, 1], 0), np.where(at_war, war[first:end, 2], 0))
+            connection.send(step)
+    except Exception as error:
+        connection.send(("error", repr(error)))
+    finally:
+        for block in blocks.values():
+            block.close()
+
+class Islands():
+    
+    def __init__(self, processes, total_group, total_agent, conflict = False,
+                 baseline_value = 10, b = 2, c = 1, e = 0.001, m = 0.2, k = 0.25, rng = None, chunk = None,
+                 timeout = 600):
+        """
+        Agent engine split across worker processes. Each worker (island) owns a run of
+        consecutive groups and evolves them locally (pairing, payoff, selection, mutation).
+        Per generation the workers only exchange the number of migrants they send to every 
+        group, and the main process runs the war on the groups' counts and publishes
+        the new composition of the groups at war, all through shared memory.
+        
+        Parameters
+        ----------
+        processes: number of worker processes (at most one per group)
+        total_group, total_agent, conflict, baseline_value, b, c, e, m, k: see Simulation
+        rng: numpy random Generator of the main process, seeds the workers, default a new one
+        chunk: see Population
+        timeout: seconds to wait for the workers at each step before giving up, default value 600
+        
+        """
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.timeout = timeout
+        self.conflict = conflict
+        self.k = k
+        self.processes = max(1, min(processes, total_group))
+        size = GroupOfAgent(total_group, total_agent, self.rng).GroupsSize(1)[0]
+        bounds = np.linspace(0, total_group, self.processes + 1).astype(np.int64)
+        shapes = {"outgoing": (self.processes, total_group, 2), "counts": (total_group, 2), "war": (total_group, 3)}
+        self.blocks = {}
+        self.arrays = {}
+        for key in shapes:
+            self.blocks[key], self.arrays[key] = _SharedArray(shapes[key], np.int64)
+        names = {key: self.blocks[key].name for key in shapes}
+        parameters = {"baseline_value": baseline_value, "b": b, "c": c, "e": e, "m": m}
+        seeds = np.random.SeedSequence(int(self.rng.integers(0, 2**63))).spawn(self.processes)
+        
+        self.composition = Composition(np.zeros(total_group), size, baseline_value, b, c, e, m, rng=self.rng) #war on counts
+        self.wars = 0 #wars fought in the last generation
+        self.war_paired = np.empty((0, 2), dtype=np.int64) #pairs of groups of the last generation
+        self.winners = np.empty(0, dtype=np.int64) #winner of each pair
+        self.workers = []
+        self.connections = []
+        for island in range(self.processes):
+            connection, worker_connection = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=_IslandWorker, daemon=True,
+                                             args=(island, int(bounds[island]), size[bounds[island]:bounds[island+1]], parameters,
+                                                   seeds[island], names, shapes, worker_connection, chunk))
+            worker.start()
+            worker_connection.close()
+            self.workers.append(worker)
+            self.connections.append(connection)
+        
+    def Generation(self):
+        """
+        One generation on all islands, and war if there is conflict
+        
+        Returns
+        -------
+        Number of Altruistic and Non-Altruistic agents after the time step
+        """
+        if not self.workers:
+            raise RuntimeError("the islands are closed")
+        counts, war = self.arrays["counts"], self.arrays["war"]
+        self.Step("migrants") #every island sent its migrants
+        self.Step("groups") #every island published its groups
+        process = self.composition
+        process.altruists[0] = counts[:, 0]
+        process.size[0] = counts[:, 1]
+        war[:, 0] = 0
+        self.wars = 0
+        self.war_paired = np.empty((0, 2), dtype=np.int64)
+        self.winners = np.empty(0, dtype=np.int64)
+        if self.conflict == True:
+            process.War(self.k)
+            self.wars = int(process.wars.sum())
+            self.war_paired, self.winners = process.war_paired, process.winners
+            war[:, 0] = process.at_war[0]
+            war[:, 1] = process.altruists[0]
+            war[:, 2] = process.size[0] - process.altruists[0]
+        self.Step("war") #every island took the war outcome
+        altruists = int(process.altruists.sum())
+        return altruists, int(process.size.sum()) - altruists
+    
+    def Step(self, step):
+        """
+        Order a step to every worker and wait until all of them are done. If a worker
+        failed, died, or the workers do not answer within timeout, all the workers 
+        are stopped and an error is raised.
+        
+        Returns
+        -------
+        None
+        """
+        failure = None
+        try:
+            for connection in self.connections:
+                connection.send(step)
+        except (BrokenPipeError, ConnectionResetError, EOFError):
+            failure = "an island worker stopped"
+        waiting = {connection: worker for connection, worker in zip(self.connections, self.workers)}
+        while waiting and failure is None:
+            ready = multiprocessing.connection.wait(list(waiting) + [worker.sentinel for worker in waiting.values()],
+                                                    self.timeout)
+            if not ready:
+                failure = "the island workers did not answer within {} seconds".format(self.timeout)
+            for connection in [connection for connection in ready if connection in waiting]:
+                try:
+                    answer = connection.recv()
+                except EOFError:
+                    answer = None
+                if answer != step:
+                    failure = "an island worker failed: {}".format(answer[1] if isinstance(answer, tuple) else "stopped")
+                    break
+                del waiting[connection]
+            if failure is None and any(not worker.is_alive() for worker in waiting.values()):
+                exit_codes = [worker.exitcode for worker in waiting.values() if not worker.is_alive()]
+                failure = "an island worker stopped, exit codes {}".format(exit_codes)
+        if failure is not None:
+            self.Close()
+            raise RuntimeError(failure)
+    
+    def Close(self):
+        """
+        Stop the workers and free the shared memory. Workers that do not stop are terminated, then killed.
+        
+        Returns
+        -------
+        None
+        """
+        if not self.workers:
+            return
+        for connection in self.connections:
+            try:
+                connection.send("stop")
+            except (BrokenPipeError, ConnectionResetError, EOFError):
+                pass
+        for worker in self.workers:
+            worker.join(self.timeout)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join(1)
+            if worker.is_alive(): #a stopped process does not take SIGTERM
+                worker.kill()
+                worker.join()
+        for connection in self.connections:
+            connection.close()
+        self.workers = []
+        self.connections = []
+        self.arrays = {}
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        
+class ResultCache():
+    
+    def __init__(self, directory, max_bytes = 2**28):
+        """
+        On-disk cache of finished runs, one .npz file of columns per run, named by the
+        sha256 of everything the result depends on. The least recently used runs are
+        removed once the files take more than max_bytes.
+        
+        Parameters
+        ----------
+        directory: where the runs are kept, made if missing
+        max_bytes: size limit of the cache, default 256 MiB
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        
+    @staticmethod
+    def Key(parameters, seed):
+        """
+        Hash of the parameters, the seed (int or SeedSequence) and ENGINE_VERSION
+        
+        Returns
+        -------
+        hex digest, str
+        """
+        if isinstance(seed, np.random.SeedSequence):
+            seed = [seed.entropy, list(seed.spawn_key), seed.pool_size]
+        else:
+            seed = int(seed)
+        content = _Plain(dict(parameters, seed=seed, engine_version=ENGINE_VERSION))
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+    
+    def Path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+    
+    def Get(self, key):
+        """
+        Columns of a cached run, and mark it as used. Another process may remove
+        the run meanwhile, which is a miss.
+        
+        Returns
+        -------
+        dict of arrays, or None if the run is not cached
+        """
+        path = self.Path(key)
+        try:
+            with np.load(path) as run:
+                columns = {name: run[name] for name in run.files}
+        except (OSError, ValueError, zipfile.BadZipFile, KeyError): #missing, or removed meanwhile, or broken
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError: #evicted by another process
+            pass
+        return columns
+    
+    def Put(self, key, columns):
+        """
+        Save the columns of a run, then evict the least recently used runs over the size limit.
+        The run is written to a temporary file of its own first, so processes saving the
+        same run at the same time do not clash.
+        
+        Returns
+        -------
+        None
+        """
+        descriptor, temporary = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                np.savez_compressed(file, **columns)
+            os.replace(temporary, self.Path(key))
+        except BaseException:
+            os.remove(temporary)
+            raise
+        self.Evict()
+    
+    def Evict(self):
+        """
+        Remove the least recently used runs until the cache takes at most max_bytes.
+        Runs removed meanwhile by another process are skipped.
+        
+        Returns
+        -------
+        None
+        """
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz"):
+                try:
+                    status = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                files.append((status.st_mtime, status.st_size, name))
+        files.sort()
+        total = sum(size for mtime, size, name in files)
+        for mtime, size, name in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+class Profiler():
+    
+    def __init__(self, enabled = False, memory = False):
+        """
+        Wall time, calls and peak allocation of each phase of Simulation.Generation.
+        When it is disabled Phase returns a shared do-nothing context, so the phases
+        cost one method call more.
+        
+        Parameters
+        ----------
+        enabled: record the phases, default False
+        memory: also record the peak allocation of each phase with tracemalloc
+            (slows the run down a lot), default False
+        """
+        self.enabled = enabled
+        self.memory = memory
+        self.tracing = False #tracemalloc was started by this profiler
+        self.generation = 0 #generation the next phases belong to
+        self.origin = perf_counter()
+        self.events = [] #(phase, generation, start, seconds, peak bytes)
+    
+    def Phase(self, name):
+        """
+        Context timing one phase
+        
+        Returns
+        -------
+        context manager
+        """
+        if not self.enabled:
+            return _NO_PHASE
+        return self.Timing(name)
+    
+    @contextlib.contextmanager
+    def Timing(self, name):
+        """
+        Time one phase and keep it as an event, see Phase
+        """
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.tracing = True
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            seconds = perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] - current if self.memory else 0
+            self.events.append((name, self.generation, start - self.origin, seconds, peak))
+    
+    def Stop(self):
+        """
+        Stop tracemalloc if the profiler started it
+        
+        Returns
+        -------
+        None
+        """
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+    
+    def Report(self):
+        """
+        Phases in the order they first ran, with their total and per generation figures
+        
+        Returns
+        -------
+        dict of phase name to dict: "calls", "seconds", "peak_bytes" (largest of all calls),
+        "seconds_per_generation" (array, one item per generation)
+        """
+        generations = max([event[1] for event in self.events] + [-1]) + 1
+        report = {}
+        for name, generation, start, seconds, peak in self.events:
+            if name not in report:
+                report[name] = {"calls": 0, "seconds": 0.0, "peak_bytes": 0,
+                                "seconds_per_generation": np.zeros(generations)}
+            phase = report[name]
+            phase["calls"] += 1
+            phase["seconds"] += seconds
+            phase["peak_bytes"] = max(phase["peak_bytes"], peak)
+            phase["seconds_per_generation"][generation] += seconds
+        return report
+    
+    def ChromeTrace(self, path):
+        """
+        Save the phases as a Chrome trace (JSON array of complete events), 
+        to open in chrome://tracing or Perfetto
+        
+        Returns
+        -------
+        None
+        """
+        trace = [{"name": name, "cat": "phase", "ph": "X", "ts": start * 1e6, "dur": seconds * 1e6,
+                  "pid": os.getpid(), "tid": 0, "args": {"generation": generation, "peak_bytes": peak}}
+                 for name, generation, start, seconds, peak in self.events]
+        with open(path, "w") as file:
+            json.dump(trace, file)
+
+class TrajectoryWriter():
+    
+    def __init__(self, directory, groups = False, chunk = 1024, dtype = np.int64):
+        """
+        Append the GenerationRecords of a run to one binary file per column in directory
+        (time, altruists, nonaltruists, wars, seconds, and with groups the share of
+        Altruistic agents of every group, one row per generation), chunk generations at a time.
+        meta.json describes the columns and the rows written, see Load.
+        
+        Parameters
+        ----------
+        directory: where the column files are written, made if missing
+        groups: also write the share of Altruistic agents of every group, default False
+        chunk: generations kept in memory between two writes, default value 1024
+        dtype: numpy type of the counts, default int64
+        """
+        self.directory = directory
+        self.groups = groups
+        self.chunk = chunk
+        self.columns = {"time": np.dtype(np.int64), "altruists": np.dtype(dtype), "nonaltruists": np.dtype(dtype),
+                        "wars": np.dtype(np.float64), "seconds": np.dtype(np.float64)}
+        if groups:
+            self.columns["fractions"] = np.dtype(np.float64)
+        self.width = 1 #values per row of the fractions column
+        self.rows = 0 #rows on disk
+        self.pending = [] #records not written yet
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, "meta.json")
+        if os.path.exists(path): #go on after the rows already there, see Truncate
+            with open(path) as file:
+                meta = json.load(file)
+            self.rows = meta["rows"]
+            self.width = meta["width"]
+        
+    def Path(self, name):
+        return os.path.join(self.directory, name + ".bin")
+    
+    def Write(self, record):
+        """
+        Add the record of a generation, the records are written every chunk generations
+        
+        Returns
+        -------
+        None
+        """
+        self.pending.append(record)
+        if len(self.pending) >= self.chunk:
+            self.Flush()
+    
+    def Flush(self):
+        """
+        Write the pending records and update meta.json
+        
+        Returns
+        -------
+        None
+        """
+        if self.pending:
+            if self.groups:
+                self.width = len(self.pending[0].fractions)
+            for name, dtype in self.columns.items():
+                values = np.array([getattr(record, name) for record in self.pending], dtype=dtype)
+                with open(self.Path(name), "ab") as file:
+                    file.write(values.tobytes())
+            self.rows += len(self.pending)
+            self.pending = []
+        meta = {"rows": self.rows, "width": self.width, 
+                "columns": {name: dtype.str for name, dtype in self.columns.items()}}
+        with open(os.path.join(self.directory, "meta.json"), "w") as file:
+            json.dump(meta, file)
+    
+    def Truncate(self, rows):
+        """
+        Keep only the first rows generations on disk, e.g. when a run starts again
+        from the beginning or from a checkpoint
+        
+        Returns
+        -------
+        None
+        """
+        self.pending = []
+        self.rows = min(self.rows, rows)
+        for name, dtype in self.columns.items():
+            width = self.width if name == "fractions" else 1
+            if os.path.exists(self.Path(name)):
+                os.truncate(self.Path(name), self.rows * width * dtype.itemsize)
+            else:
+                open(self.Path(name), "wb").close()
+        self.Flush()
+    
+    @staticmethod
+    def Load(directory):
+        """
+        Columns written by a TrajectoryWriter, as read-only memmaps
+        
+        Returns
+        -------
+        dict of column name to array (rows,), fractions (rows, groups)
+        """
+        with open(os.path.join(directory, "meta.json")) as file:
+            meta = json.load(file)
+        columns = {}
+        for name, dtype in meta["columns"].items():
+            shape = (meta["rows"], meta["width"]) if name == "fractions" else (meta["rows"],)
+            if meta["rows"] == 0:
+                columns[name] = np.empty(shape, dtype=dtype)
+            else:
+                columns[name] = np.memmap(os.path.join(directory, name + ".bin"), dtype=dtype, mode="r", shape=shape)
+        return columns
+
+def _MinMaxDecimate(values, points):
+    """
+    Indices of at most about points items of values that keep their shape: 
+    the values are cut in points/2 runs and the smallest and largest of each run are kept
+    
+    Returns
+    -------
+    sorted indices, array
+    """
+    values = np.asarray(values)
+    if len(values) <= points:
+        return np.arange(len(values))
+    runs = max(points // 2, 1)
+    width = -(-len(values) // runs)
+    padded = np.full(runs * width, np.nan)
+    padded[:len(values)] = values
+    blocks = padded.reshape(runs, width)
+    start = np.arange(runs) * width
+    keep = np.concatenate((start + np.nanargmin(blocks, axis=1), start + np.nanargmax(blocks, axis=1), [len(values) - 1]))
+    return np.unique(keep)
+
+def _Figure(show = False):
+    """
+    New matplotlib figure, matplotlib is imported on first use. With show it comes from
+    pyplot, otherwise it is drawn by its own Agg canvas: no window is opened, batch jobs
+    never block, and pyplot's backend (e.g. inline figures of a notebook) is left as it is.
+    
+    Returns
+    -------
+    matplotlib Figure
+    """
+    if show:
+        import matplotlib.pyplot as plt
+        return plt.figure()
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    return figure
+
+GenerationRecord = namedtuple("GenerationRecord", ["time", "altruists", "nonaltruists", "fractions", "wars", "seconds",
+                                                   "war_paired", "winners"])
+GenerationRecord.__doc__ = """
+One generation of a Simulation, see Simulation.iter_generations
+
+time: generation number, starting at 0
+altruists, nonaltruists: Number of Altruistic and Non-Altruistic agents after the generation
+fractions: share of Altruistic agents in each group, array (groups with no agent are 0)
+wars: wars fought in the generation
+seconds: wall time of the generation
+war_paired: groups that fought each other, int array (wars, 2), empty for the meanfield engine
+winners: group that won each of these wars, int array
+"""
+
+class Simulation():
+    
+    def __init__(self,total_group,total_agent,t,conflict = False,
+                 baseline_value = 10, b = 2, c = 1, e = 0.001, m = 0.2, k = 0.25, engine = "agent", seed = None,
+                 directory = None, chunk = None, backend = "numpy", processes = None,
+                 fixation = None, window = None, tolerance = 0.01, budget = None,
+                 checkpoint = None, checkpoint_every = 100, keep = 2, cache = None, profile = False,
+                 trajectory = None, trajectory_groups = False):
+        """
+        Set values
+        
+        Parameters
+        ----------
+        total_group: total groups under evolution, int
+        total_agent: total agent under evolution, int
+        t: time, how much time the simulation will run
+        conflict: war exist or not, default value False
+        baseline_value, b, c, e, m: game and evolution values, see Evolution
+        k: probability of joining a war, see War
+        engine: "agent" keeps every agent (Evolution, War), 
+            "count" keeps only the number of Altruistic agents and size of groups (Composition),
+            "meanfield" follows their expected values without randomness after the set up (MeanField), 
+            the counts are then floats. Without randomness migration makes all groups alike, so
+            war changes nothing there: conflict and k can not be screened with "meanfield".
+            Default value "agent"
+        seed: seed of the simulation's numpy random Generator (int, SeedSequence, ...), 
+            default None (fresh entropy). Every draw of the simulation comes from this generator.
+        directory: agent engine, keep the population in memmap files in this directory, 
+            for populations larger than memory, default None
+        chunk: agent engine, agents processed at a time by each phase, default None (CHUNK)
+        backend: agent engine, "numpy" runs each step of Evolution, "numba" runs them in one
+            compiled kernel over all groups in parallel (numpy is used if numba is not installed),
+            default value "numpy"
+        processes: agent engine, split the groups across this many worker processes (Islands),
+            default None (one process)
+        fixation: stop Run once the share of Altruistic agents reaches this value, or falls to
+            1 - fixation, e.g. 0.99, default None (never)
+        window, tolerance: stop Run once the mean share of Altruistic agents over the last window/2 
+            generations is within tolerance of the mean over the window/2 generations before, 
+            default None (never), 0.01
+        budget: stop Run after this many seconds of wall time, default None (never)
+        checkpoint: directory Run saves a checkpoint to every checkpoint_every generations, 
+            see Checkpoint and Resume, default None (no checkpoint)
+        checkpoint_every: generations between checkpoints, default value 100
+        keep: checkpoints kept in the directory, older ones are removed, default value 2
+        cache: ResultCache, or its directory, Run takes the counts over time from it if this run 
+            was done before, and saves them there otherwise. Only used with an int or SeedSequence
+            seed, without budget and without trajectory. On a hit the groups are left as they were 
+            set up. Default None
+        profile: record the time of each phase of every generation, True, "memory" to record 
+            their peak allocation too, or a Profiler, see Profile, default False
+        trajectory: directory Run streams every generation to, see TrajectoryWriter, default None
+        trajectory_groups: also stream the share of Altruistic agents of every group, default False
+        
+        """
+        if engine not in ("agent", "count", "meanfield"):
+            raise ValueError("unknown engine {}".format(engine))
+        if backend not in ("numpy", "numba"):
+            raise ValueError("unknown backend {}".format(backend))
+        if backend == "numba" and importlib.util.find_spec("numba") is None:
+            warnings.warn("numba is not installed, using the numpy backend")
+            backend = "numpy"
+        if checkpoint is not None and processes is not None and processes > 1:
+            raise ValueError("checkpoints are not supported with processes > 1")
+        self.t = t #time
+        self.conflict = conflict #groups war
+        self.baseline_value = baseline_value
+        self.b = b
+        self.c = c
+        self.e = e
+        self.m = m
+        self.k = k
+        self.total_group = total_group
+        self.total_agent = total_agent
+        self.engine = engine
+        self.backend = backend
+        self.rng = np.random.default_rng(seed)
+        self.seed = seed
+        self.processes = processes
+        self.cache = ResultCache(cache) if isinstance(cache, (str, os.PathLike)) else cache
+        self.profiler = profile if isinstance(profile, Profiler) else Profiler(bool(profile), profile == "memory")
+        self.trajectory = None
+        if trajectory is not None:
+            self.trajectory = TrajectoryWriter(trajectory, trajectory_groups,
+                                               dtype=np.float64 if engine == "meanfield" else np.int64)
+        self.population = None #modefied over time, agent engine
+        self.composition = None #modefied over time, count engine
+        self.islands = None #agent engine on worker processes
+        if self.engine == "agent" and processes is not None and processes > 1:
+            self.islands = Islands(processes, self.total_group, self.total_agent, self.conflict, self.baseline_value,
+                                   self.b, self.c, self.e, self.m, self.k, self.rng, chunk)
+        elif self.engine == "agent":
+            self.population = GroupOfAgent(self.total_group,self.total_agent,self.rng).SetupPopulation(directory, chunk)
+        elif self.engine == "meanfield":
+            altruists, size = GroupOfAgent(self.total_group,self.total_agent,self.rng).SetupCounts()
+            self.composition = MeanField(altruists, size, self.baseline_value, self.b, self.c, self.e, self.m)
+        else:
+            altruists, size = GroupOfAgent(self.total_group,self.total_agent,self.rng).SetupCounts()
+            self.composition = Composition(altruists, size, self.baseline_value, self.b, self.c, self.e, self.m, rng=self.rng)
+        self.Number_of_Altruists = []
+        self.Number_of_NonAltruists = []
+        self.generation = 0 #generations run so far
+        self.wars = 0 #wars fought in the last generation
+        self.war_paired = np.empty((0, 2), dtype=np.int64) #groups that fought in the last generation
+        self.winners = np.empty(0, dtype=np.int64) #winner of each of these wars
+        self.fixation = fixation
+        self.window = window
+        self.tolerance = tolerance
+        self.budget = budget
+        self.directory = directory
+        self.chunk = chunk
+        self.checkpoint = checkpoint
+        self.checkpoint_every = checkpoint_every
+        self.keep = keep
+        self.stopped_at = None #generations run by Run
+        self.stop_reason = None #"fixation", "stable", "budget", or None if Run went the whole time
+    
+    @property
+    def agent_groups(self):
+        """
+        Groups of agents of the agent engine, list of arrays
+        """
+        return None if self.population is None else self.population.Groups()
+    
+    @property
+    def rng_state(self):
+        """
+        State of the simulation's random generator, a dict that can be assigned back
+        """
+        return self.rng.bit_generator.state
+    
+    @rng_state.setter
+    def rng_state(self, state):
+        self.rng.bit_generator.state = state
+    
+    def iter_generations(self, t = None):
+        """
+        Evolve the groups one generation at a time, without keeping any history
+        
+        Parameters
+        ----------
+        t: generations to run, default the rest of the simulation's time
+        
+        Yields
+        ------
+        GenerationRecord of each generation
+        """
+        t = self.t - self.generation if t is None else t
+        try:
+            for time in range(t):
+                start = perf_counter()
+                altruists, nonaltruists = self.Generation()
+                yield GenerationRecord(self.generation - 1, altruists, nonaltruists, self.GroupsFraction(),
+                                       self.wars, perf_counter() - start, self.war_paired, self.winners)
+        finally:
+            self.profiler.Stop()
+    
+    def Close(self):
+        """
+        Stop the worker processes of the islands (processes > 1), the simulation can not 
+        evolve any more after it. Run closes the simulation when it is done, iter_generations
+        does not: close it, or use the simulation as a context manager.
+        
+        Returns
+        -------
+        None
+        """
+        if self.islands is not None:
+            self.islands.Close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exception):
+        self.Close()
+    
+    def Run(self):
+        key = self.CacheKey()
+        if key is not None:
+            columns = self.cache.Get(key)
+            if columns is not None:
+                self.Number_of_Altruists = columns["altruists"].tolist()
+                self.Number_of_NonAltruists = columns["nonaltruists"].tolist()
+                self.stop_reason = str(columns["stop_reason"]) or None
+                self.stopped_at = len(self.Number_of_Altruists)
+                self.generation = self.stopped_at
+                self.Close()
+                return
+        
+        start = perf_counter()
+        shares = deque(maxlen=self.window) if self.window else None
+        if shares is not None: #after a resume, the shares of the generations already run
+            for altruists, nonaltruists in zip(self.Number_of_Altruists[-self.window:], self.Number_of_NonAltruists[-self.window:]):
+                total = altruists + nonaltruists
+                shares.append(altruists / total if total > 0 else 0.0)
+        self.stop_reason = None
+        if self.trajectory is not None:
+            self.trajectory.Truncate(self.generation) #from the start, or from a checkpoint
+        try:
+            for record in self.iter_generations():
+                self.Number_of_Altruists.append(record.altruists)
+                self.Number_of_NonAltruists.append(record.nonaltruists)
+                if self.trajectory is not None:
+                    self.trajectory.Write(record)
+                if self.checkpoint is not None and self.generation % self.checkpoint_every == 0:
+                    if self.trajectory is not None:
+                        self.trajectory.Flush()
+                    self.Checkpoint(self.checkpoint)
+                self.stop_reason = self.Converged(record, shares, perf_counter() - start)
+                if self.stop_reason is not None:
+                    break
+        finally:
+            if self.trajectory is not None:
+                self.trajectory.Flush()
+            self.Close()
+        self.stopped_at = len(self.Number_of_Altruists)
+        if key is not None:
+            altruists, nonaltruists = self.Series()
+            self.cache.Put(key, {"altruists": altruists, "nonaltruists": nonaltruists,
+                                 "stop_reason": np.array(self.stop_reason or "")})
+    
+    def Series(self):
+        """
+        Number of Altruistic and Non-Altruistic agents over time, 
+        int arrays, float arrays for the meanfield engine
+        
+        Returns
+        -------
+        two arrays
+        """
+        dtype = np.float64 if self.engine == "meanfield" else np.int64
+        return np.array(self.Number_of_Altruists, dtype=dtype), np.array(self.Number_of_NonAltruists, dtype=dtype)
+    
+    def Profile(self, trace = None):
+        """
+        Time, calls and peak allocation of each phase, recorded with profile=True
+        
+        Parameters
+        ----------
+        trace: also save the phases as a Chrome trace JSON file to this path, default None
+        
+        Returns
+        -------
+        dict, see Profiler.Report
+        """
+        if trace is not None:
+            self.profiler.ChromeTrace(trace)
+        return self.profiler.Report()
+    
+    def CacheKey(self):
+        """
+        ResultCache key of this run, from everything that changes its results
+        
+        Returns
+        -------
+        str, or None if the run is not cached (no cache, no fixed seed, budget set, trajectory set, or resumed)
+        """
+        fixed = isinstance(self.seed, (int, np.integer, np.random.SeedSequence)) and not isinstance(self.seed, bool)
+        if (self.cache is None or not fixed or self.budget is not None or self.trajectory is not None
+                or self.generation != 0):
+            return None
+        parameters = self.Parameters()
+        for name in ("directory", "checkpoint", "checkpoint_every", "keep", "trajectory", "trajectory_groups"): #no effect on the results
+            del parameters[name]
+        parameters["processes"] = self.processes if self.islands is not None else None
+        for name in ("total_group", "total_agent", "t"): #the same run gets the same key, e.g. b=2 and b=2.0
+            parameters[name] = int(parameters[name])
+        for name in ("baseline_value", "b", "c", "e", "m", "k", "tolerance"):
+            parameters[name] = float(parameters[name])
+        parameters["conflict"] = bool(parameters["conflict"])
+        if parameters["fixation"] is not None:
+            parameters["fixation"] = float(parameters["fixation"])
+        if parameters["window"] is not None:
+            parameters["window"] = int(parameters["window"])
+        parameters["chunk"] = CHUNK if parameters["chunk"] is None else int(parameters["chunk"])
+        return ResultCache.Key(parameters, self.seed)
+    
+    def Parameters(self):
+        """
+        Arguments to build the same Simulation again
+        
+        Returns
+        -------
+        dict
+        """
+        return {"total_group": self.total_group, "total_agent": self.total_agent, "t": self.t,
+                "conflict": self.conflict, "baseline_value": self.baseline_value, "b": self.b, "c": self.c,
+                "e": self.e, "m": self.m, "k": self.k, "engine": self.engine, "backend": self.backend,
+                "fixation": self.fixation, "window": self.window, "tolerance": self.tolerance, "budget": self.budget,
+                "directory": self.directory, "chunk": self.chunk, "checkpoint": self.checkpoint,
+                "checkpoint_every": self.checkpoint_every, "keep": self.keep,
+                "trajectory": None if self.trajectory is None else self.trajectory.directory,
+                "trajectory_groups": self.trajectory is not None and self.trajectory.groups}
+    
+    def Checkpoint(self, directory):
+        """
+        Save the state of the simulation (groups, generation, counts over time, parameters and
+        random generator state) to directory/checkpoint-<generation>.npz, and remove all but 
+        the keep newest checkpoints. The file is written under a temporary name first, so a 
+        killed job never leaves a broken checkpoint behind.
+        
+        Returns
+        -------
+        path of the checkpoint
+        """
+        if self.islands is not None:
+            raise ValueError("checkpoints are not supported with processes > 1")
+        os.makedirs(directory, exist_ok=True)
+        altruists, nonaltruists = self.Series()
+        state = {"generation": self.generation, "wars": self.wars,
+                 "altruists_over_time": altruists, "nonaltruists_over_time": nonaltruists,
+                 "parameters": json.dumps(_Plain(self.Parameters())), "rng_state": json.dumps(self.rng_state)}
+        if self.population is not None:
+            state["traits"] = self.population.traits[:self.population.number_of_agents]
+            state["size"] = self.population.Size()
+        else:
+            state["altruists"] = self.composition.altruists
+            state["size"] = self.composition.size
+        path = os.path.join(directory, "checkpoint-{:010d}.npz".format(self.generation))
+        with open(path + ".tmp", "wb") as file:
+            np.savez(file, **state)
+        os.replace(path + ".tmp", path)
+        for old in Simulation.Checkpoints(directory)[:-self.keep] if self.keep > 0 else []:
+            os.remove(old)
+        return path
+    
+    @staticmethod
+    def Checkpoints(directory):
+        """
+        Checkpoints in a directory, oldest first
+        
+        Returns
+        -------
+        list of paths
+        """
+        if not os.path.isdir(directory):
+            return []
+        names = sorted(name for name in os.listdir(directory) if name.startswith("checkpoint-") and name.endswith(".npz"))
+        return [os.path.join(directory, name) for name in names]
+    
+    @classmethod
+    def Resume(cls, path, **changes):
+        """
+        Simulation restored from a checkpoint file, or from the newest checkpoint of a directory.
+        Run then goes on from the saved generation and gives the same results as the run that
+        was interrupted (the budget stopping criterion starts again).
+        
+        Parameters
+        ----------
+        path: checkpoint file or directory
+        changes: Simulation arguments replacing the saved ones, e.g. directory or chunk
+        
+        Returns
+        -------
+        Simulation
+        """
+        if os.path.isdir(path):
+            checkpoints = cls.Checkpoints(path)
+            if not checkpoints:
+                raise FileNotFoundError("no checkpoint in {}".format(path))
+            path = checkpoints[-1]
+        with np.load(path) as state:
+            parameters = json.loads(str(state["parameters"]))
+            parameters.update(changes)
+            simulation = cls(parameters.pop("total_group"), parameters.pop("total_agent"), parameters.pop("t"),
+                             **parameters)
+            if simulation.population is not None:
+                simulation.population = Population(state["traits"], state["size"], directory=simulation.directory,
+                                                   chunk=simulation.chunk)
+            else:
+                simulation.composition.altruists[...] = state["altruists"]
+                simulation.composition.size[...] = state["size"]
+            simulation.generation = int(state["generation"])
+            simulation.wars = state["wars"].item()
+            simulation.Number_of_Altruists = state["altruists_over_time"].tolist()
+            simulation.Number_of_NonAltruists = state["nonaltruists_over_time"].tolist()
+            simulation.rng_state = json.loads(str(state["rng_state"]))
+        return simulation
+    
+    def Converged(self, record, shares = None, seconds = 0.0):
+        """
+        Check the stopping criteria after a generation
+        
+        Parameters
+        ----------
+        record: GenerationRecord of the generation
+        shares: deque of the last shares of Altruistic agents (maxlen window), updated, default None
+        seconds: wall time of the run so far
+        
+        Returns
+        -------
+        reason to stop, "fixation", "stable" or "budget", or None to go on
+        """
+        total = record.altruists + record.nonaltruists
+        share = record.altruists / total if total > 0 else 0.0
+        if self.fixation is not None and (share >= self.fixation or share <= 1 - self.fixation):
+            return "fixation"
+        if shares is not None:
+            shares.append(share)
+            if len(shares) == shares.maxlen and shares.maxlen >= 2:
+                values = np.array(shares)
+                half = len(values) // 2
+                if abs(values[-half:].mean() - values[:half].mean()) <= self.tolerance:
+                    return "stable"
+        if self.budget is not None and seconds >= self.budget:
+            return "budget"
+        return None
+    
+    def GroupsFraction(self):
+        """
+        Share of Altruistic agents in each group, groups with no agent are 0
+        
+        Returns
+        -------
+        array
+        """
+        if self.population is not None:
+            altruists, size = self.population.Altruists(), self.population.Size()
+        elif self.islands is not None:
+            altruists, size = self.islands.composition.altruists[0], self.islands.composition.size[0]
+        else:
+            altruists, size = self.composition.altruists[0], self.composition.size[0]
+        return np.divide(altruists, size, out=np.zeros(len(size)), where=size > 0)
+            
+    def Generation(self):
+        """
+        Evolve the groups for one time step, and war if there is conflict
+        
+        Returns
+        -------
+        Number of Altruistic and Non-Altruistic agents after the time step
+        """
+        phase = self.profiler.Phase
+        self.profiler.generation = self.generation
+        self.generation += 1
+        self.wars = 0
+        self.war_paired = np.empty((0, 2), dtype=np.int64)
+        self.winners = np.empty(0, dtype=np.int64)
+        if self.islands is not None:
+            with phase("islands"):
+                altruists, nonaltruists = self.islands.Generation()
+            self.wars = self.islands.wars
+            self.war_paired, self.winners = self.islands.war_paired, self.islands.winners
+            return altruists, nonaltruists
+        if self.engine == "meanfield":
+            process = self.composition #use MeanField class
+            with phase("payoff"):
+                process.Payoff()
+            with phase("selection"):
+                process.Fitness_determination()
+            with phase("mutation"):
+                process.Mutation()
+            with phase("migration"):
+                process.Migration()
+            if self.conflict == True:
+                with phase("war"):
+                    process.War(self.k)
+                self.wars = float(process.wars.sum())
+            altruists = float(process.altruists.sum())
+            return altruists, float(process.size.sum()) - altruists
+        if self.engine == "count":
+            process = self.composition #use Composition class
+            with phase("payoff"):
+                process.Payoff()
+            with phase("selection"):
+                process.Fitness_determination()
+            with phase("mutation"):
+                process.Mutation()
+            with phase("migration"):
+                process.Migration()
+            if self.conflict == True:
+                with phase("war"):
+                    process.War(self.k)
+                self.wars = int(process.wars.sum())
+                self.war_paired, self.winners = process.war_paired, process.winners
+            altruists = int(process.altruists.sum())
+            return altruists, int(process.size.sum()) - altruists
+        
+        process = Evolution(self.population, self.baseline_value, self.b, self.c, self.e, self.m, rng=self.rng) #use Evolution class
+        if self.backend == "numba":
+            with phase("compiled"):
+                after_mig = process.CompiledGeneration()
+        else:
+            with phase("pairing"):
+                process.GroupsLength()
+                process.Those_agents_play()
+                process.Getting_group_partner()
+            with phase("payoff"):
+                process.Payoff()
+                process.NonPlayerPayoff()
+            with phase("selection"):
+                process.Fitness_determination()
+            with phase("mutation"):
+                process.Mutation()
+            with phase("migration"):
+                after_mig = process.Migration() #agents after migration
+        
+        if self.conflict == True:
+            with phase("compete"):
+                after_war = War(after_mig, self.k, process.GroupsStrength(), self.rng) #use war class, strength from this generation's game
+                after_war.Compete()
+            with phase("compete_partner"):
+                after_war.CompetePartner()
+            with phase("conflicts"):
+                after_war.GroupsConflicts()
+            self.wars = len(after_war.fought)
+            self.war_paired, self.winners = after_war.fought, after_war.winners
+        
+        altruists = int(self.population.Altruists().sum())
+        return altruists, self.population.number_of_agents - altruists
+        
+    def Plot(self, directory = ".", show = False, points = 4000, dpi = 300):
+        """
+        fig-1: plot Number of Altruistic and Number of Non-Altruistic over time, seperately
+        fig-2: plot Number of Altruistic and Non-Altruistic over time, together
+        fig-3: plot Number of Altruistic against Number of Non-Altruistic
+        Both figure saves as image
+        
+        Parameters
+        ----------
+        directory: where the images are saved, default the current directory
+        show: open the figures in a window (blocks until they are closed), default False
+        points: long runs are min-max decimated to about this many points per line, default 4000
+        dpi: resolution of the images, default 300
+        
+        Returns
+        -------
+        paths of the images, list
+        """
+        altruists, nonaltruists = self.Series()
+        keep = np.union1d(_MinMaxDecimate(altruists, points), _MinMaxDecimate(nonaltruists, points))
+        time, altruists, nonaltruists = keep, altruists[keep], nonaltruists[keep]
+        paths = [os.path.join(directory, name) for name in ("Altruistic and Non-Altruistic population over time.png",
+                                                            "Altruistic and Non-Altruistic population over time (together).png",
+                                                            "Change of Altruistic against Non-Altruistic.png")]
+        
+        fig1 = _Figure(show)
+        ax = fig1.subplots(nrows=2, ncols=1, squeeze=False)
+        ax[0][0].plot(time,nonaltruists,c="b", label = "Non-Altruists")
+        ax[1][0].plot(time,altruists, c="g", label = "Altruists" )
+        ax[0][0].set_xlabel("Time")
+        ax[1][0].set_xlabel("Time")
+        ax[0][0].set_ylabel("Number of Non-Altruistic")
+        ax[1][0].set_ylabel("Number of Altruistic")
+        ax[0][0].set_title("Altruistic and Non-Altruistic population over time")
+        ax[0][0].legend()
+        ax[1][0].legend()
+        fig1.tight_layout()
+        fig1.savefig(paths[0], dpi=dpi)
+        
+        fig2 = _Figure(show)
+        ax = fig2.subplots(nrows=1, ncols=1, squeeze=False)
+        ax[0][0].plot(time,nonaltruists,c="b", label = "Non-Altruists")
+        ax[0][0].plot(time,altruists, c="g", label = "Altruists" )
+        ax[0][0].set_xlabel("Time")
+        ax[0][0].set_ylabel("Altruistic and Non-Altruistic population")
+        ax[0][0].set_title("Altruistic and Non-Altruistic population over time")
+        ax[0][0].legend()
+        fig2.tight_layout()
+        fig2.savefig(paths[1], dpi=dpi)
+        
+        fig3 = _Figure(show)
+        ax = fig3.subplots(nrows=1, ncols=1, squeeze=False)
+        ax[0][0].plot(nonaltruists,altruists)
+        ax[0][0].set_xlabel("Number of Non-Altruistic")
+        ax[0][0].set_ylabel("Number of Altruistic")
+        ax[0][0].set_title("Altruistic population against  Non-Altruistic population")
+        fig3.tight_layout()
+        fig3.savefig(paths[2], dpi=dpi)
+        if show:
+            import matplotlib.pyplot as plt
+            plt.show()
+            for figure in (fig1, fig2, fig3):
+                plt.close(figure)
+        return paths
+
+
+class BatchSimulation():
+    
+    def __init__(self,replicates,total_group,total_agent,t,conflict = False,
+                 baseline_value = 10, b = 2, c = 1, e = 0.001, m = 0.2, k = 0.25, chunk = 256, seed = None):
+        """
+        Run independent replicates of Simulation as one array computation. The counts of 
+        all replicates of a chunk live in one (replicates, groups) Composition, so each phase
+        advances every replicate of the chunk in a single step. On one core a generation of 
+        256 replicates takes about 5 ms with 20 groups of 20 agents, and 0.3 s with 1000 groups 
+        of 100 agents, see benchmark.Batch_timing.
+        
+        Parameters
+        ----------
+        replicates: number of independent simulations, int
+        total_group, total_agent, t, conflict, baseline_value, b, c, e, m, k: see Simulation
+        chunk: replicates evolved together, bounds the memory, default value 256
+        seed: seed of the batch's numpy random Generator, default None (fresh entropy)
+        
+        """
+        self.replicates = replicates
+        self.total_group = total_group
+        self.total_agent = total_agent
+        self.t = t
+        self.conflict = conflict
+        self.baseline_value = baseline_value
+        self.b = b
+        self.c = c
+        self.e = e
+        self.m = m
+        self.k = k
+        self.chunk = chunk
+        self.rng = np.random.default_rng(seed)
+        self.Number_of_Altruists = np.zeros((replicates, t), dtype=np.int64)
+        self.Number_of_NonAltruists = np.zeros((replicates, t), dtype=np.int64)
+        
+    def Run(self):
+        """
+        Run every replicate, chunk by chunk
+        
+        Returns
+        -------
+        Number of Altruistic and Non-Altruistic agents, arrays (replicates, t)
+        """
+        for start in range(0, self.replicates, self.chunk):
+            rows = min(self.chunk, self.replicates - start)
+            altruists, size = GroupOfAgent(self.total_group,self.total_agent,self.rng).SetupCounts(rows)
+            process = Composition(altruists, size, self.baseline_value, self.b, self.c, self.e, self.m, rng=self.rng)
+            for time in range(self.t):
+                process.Payoff()
+                process.Fitness_determination()
+                process.Mutation()
+                process.Migration()
+                if self.conflict == True:
+                    process.War(self.k)
+                altruists = process.altruists.sum(axis=1)
+                self.Number_of_Altruists[start:start + rows, time] = altruists
+                self.Number_of_NonAltruists[start:start + rows, time] = process.size.sum(axis=1) - altruists
+        return self.Number_of_Altruists, self.Number_of_NonAltruists
+
+"""Parameter sweep"""
+
+class ReplicateAggregator():
+    
+    def __init__(self, relative_accuracy = 0.01):
+        """
+        Running statistics of Number of Altruistic agents over replicates, per generation,
+        without keeping the trajectories: count, mean and variance (Welford, merged with 
+        Chan's formula), quantiles from log-bucket sketches (DDSketch: a quantile is within 
+        relative_accuracy of the true one), and the share of replicates where Altruistic 
+        agents are fixed or lost. Memory grows with the number of generations only. 
+        Aggregators of different processes can be merged.
+        
+        Parameters
+        ----------
+        relative_accuracy: relative error of the quantiles, default value 0.01
+        """
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.count = np.zeros(0, dtype=np.int64) #replicates that reached each generation
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0) #sum of squared deviations from the mean
+        self.fixed = np.zeros(0, dtype=np.int64) #replicates with only Altruistic agents
+        self.lost = np.zeros(0, dtype=np.int64) #replicates with no Altruistic agent
+        self.zeros = np.zeros(0, dtype=np.int64) #sketch: values not above 0
+        self.bins = np.zeros((0, 0), dtype=np.int64) #sketch: values in (gamma^(k-1), gamma^k], k = low + column
+        self.low = 0
+        
+    def __len__(self):
+        return len(self.count)
+    
+    def Grow(self, generations, low = None, high = None):
+        """
+        Make room for generations rows and the sketch buckets low .. high
+        
+        Returns
+        -------
+        None
+        """
+        extra = generations - len(self.count)
+        if extra > 0:
+            self.count = np.concatenate((self.count, np.zeros(extra, dtype=np.int64)))
+            self.mean = np.concatenate((self.mean, np.zeros(extra)))
+            self.m2 = np.concatenate((self.m2, np.zeros(extra)))
+            self.fixed = np.concatenate((self.fixed, np.zeros(extra, dtype=np.int64)))
+            self.lost = np.concatenate((self.lost, np.zeros(extra, dtype=np.int64)))
+            self.zeros = np.concatenate((self.zeros, np.zeros(extra, dtype=np.int64)))
+            self.bins = np.concatenate((self.bins, np.zeros((extra, self.bins.shape[1]), dtype=np.int64)))
+        if low is None:
+            return
+        if self.bins.shape[1] == 0:
+            self.low = low
+        new_low = min(low, self.low)
+        new_high = max(high, self.low + self.bins.shape[1] - 1)
+        if new_low < self.low or new_high >= self.low + self.bins.shape[1]:
+            bins = np.zeros((len(self.count), new_high - new_low + 1), dtype=np.int64)
+            bins[:, self.low - new_low:self.low - new_low + self.bins.shape[1]] = self.bins
+            self.bins = bins
+            self.low = new_low
+    
+    def Bucket(self, values):
+        """
+        Sketch bucket of positive values
+        
+        Returns
+        -------
+        int array
+        """
+        return np.ceil(np.log(values) / np.log(self.gamma)).astype(np.int64)
+    
+    def Update(self, generation, altruists, nonaltruists):
+        """
+        Fold one generation of one or more replicates in, only the row of that generation 
+        is changed. Whole trajectories are folded in faster by Add.
+        
+        Parameters
+        ----------
+        generation: generation number
+        altruists, nonaltruists: Number of Altruistic and Non-Altruistic agents, number or array
+        
+        Returns
+        -------
+        None
+        """
+        altruists = np.atleast_1d(np.asarray(altruists, dtype=np.float64))
+        nonaltruists = np.atleast_1d(np.asarray(nonaltruists, dtype=np.float64))
+        if len(altruists) == 0:
+            return
+        self.Grow(generation + 1)
+        count = len(altruists)
+        mean = altruists.mean()
+        total = self.count[generation] + count
+        delta = mean - self.mean[generation]
+        self.mean[generation] += delta * count / total
+        self.m2[generation] += ((altruists - mean)**2).sum() + delta**2 * self.count[generation] * count / total
+        self.count[generation] = total
+        self.fixed[generation] += np.count_nonzero((nonaltruists == 0) & (altruists > 0))
+        self.lost[generation] += np.count_nonzero(altruists == 0)
+        positive = altruists > 0
+        self.zeros[generation] += np.count_nonzero(~positive)
+        if positive.any():
+            bucket = self.Bucket(altruists[positive])
+            self.Grow(len(self.count), int(bucket.min()), int(bucket.max()))
+            np.add.at(self.bins[generation], bucket - self.low, 1)
+    
+    def Add(self, altruists, nonaltruists, stop_reason = None):
+        """
+        Fold whole replicates in: one trajectory, or a batch (replicates, t) such as
+        the output of BatchSimulation.Run or the columns of Sweep. Values below 0 (the padding 
+        of Sweep) are skipped, except for the runs that Run stopped early: their last value 
+        is carried forward to the end, so they still count in the later generations.
+        
+        Parameters
+        ----------
+        altruists, nonaltruists: Number of Altruistic and Non-Altruistic agents over time
+        stop_reason: reason each run stopped early, "" if it went the whole time (Sweep's
+            "stop_reason" column), default None (no run stopped early)
+        
+        Returns
+        -------
+        None
+        """
+        altruists = np.atleast_2d(np.asarray(altruists, dtype=np.float64))
+        nonaltruists = np.atleast_2d(np.asarray(nonaltruists, dtype=np.float64))
+        generations = np.broadcast_to(np.arange(altruists.shape[1]), altruists.shape)
+        valid = (altruists >= 0) & (nonaltruists >= 0)
+        if stop_reason is not None:
+            stopped = (np.atleast_1d(np.asarray(stop_reason)) != "") & valid.any(axis=1)
+            last = np.maximum.accumulate(np.where(valid, generations, 0), axis=1)[stopped]
+            altruists[stopped] = np.take_along_axis(altruists[stopped], last, axis=1)
+            nonaltruists[stopped] = np.take_along_axis(nonaltruists[stopped], last, axis=1)
+            valid[stopped] = True
+        self.Fold(generations[valid], altruists[valid], nonaltruists[valid])
+    
+    def Fold(self, generations, altruists, nonaltruists):
+        """
+        Fold values of any generations in: the statistics of the new values of each generation 
+        are computed at once and merged with the running ones
+        
+        Returns
+        -------
+        None
+        """
+        if len(generations) == 0:
+            return
+        self.Grow(int(generations.max()) + 1)
+        rows = len(self.count)
+        count = np.bincount(generations, minlength=rows)
+        total = np.bincount(generations, weights=altruists, minlength=rows)
+        mean = np.divide(total, count, out=np.zeros(rows), where=count > 0)
+        m2 = np.bincount(generations, weights=(altruists - mean[generations])**2, minlength=rows)
+        fixed = np.bincount(generations[(nonaltruists == 0) & (altruists > 0)], minlength=rows)
+        lost = np.bincount(generations[altruists == 0], minlength=rows)
+        
+        positive = altruists > 0
+        zeros = np.bincount(generations[~positive], minlength=rows)
+        bins = None
+        if positive.any():
+            bucket = self.Bucket(altruists[positive])
+            self.Grow(rows, int(bucket.min()), int(bucket.max()))
+            bins = np.zeros(self.bins.shape, dtype=np.int64)
+            np.add.at(bins, (generations[positive], bucket - self.low), 1)
+        self.Combine(count, mean, m2, fixed, lost, zeros, bins, self.low)
+    
+    def Combine(self, count, mean, m2, fixed, lost, zeros, bins, low):
+        """
+        Chan's merge of the statistics of other values, given over the same generations
+        (sketch buckets starting at low)
+        
+        Returns
+        -------
+        None
+        """
+        total = self.count + count
+        delta = mean - self.mean
+        share = np.divide(count, total, out=np.zeros(len(total)), where=total > 0)
+        self.mean = self.mean + delta * share
+        self.m2 = self.m2 + m2 + delta**2 * self.count * share
+        self.count = total
+        self.fixed += fixed
+        self.lost += lost
+        self.zeros += zeros
+        if bins is not None and bins.shape[1] > 0:
+            self.Grow(len(self.count), low, low + bins.shape[1] - 1)
+            self.bins[:, low - self.low:low - self.low + bins.shape[1]] += bins
+    
+    def Merge(self, other):
+        """
+        Fold the statistics of another aggregator (e.g. from another process) in
+        
+        Returns
+        -------
+        self
+        """
+        if other.gamma != self.gamma:
+            raise ValueError("cannot merge aggregators of different relative accuracy")
+        rows = max(len(self), len(other))
+        self.Grow(rows)
+        other.Grow(rows)
+        self.Combine(other.count, other.mean, other.m2, other.fixed, other.lost, other.zeros,
+                     other.bins, other.low)
+        return self
+    
+    def Variance(self):
+        """
+        Sample variance of Number of Altruistic agents of each generation (nan below 2 replicates)
+        
+        Returns
+        -------
+        array
+        """
+        return np.divide(self.m2, self.count - 1, out=np.full(len(self.count), np.nan), where=self.count > 1)
+    
+    def Quantile(self, q):
+        """
+        Quantile q (0 to 1) of Number of Altruistic agents of each generation, 
+        within relative_accuracy (nan where no replicate reached the generation)
+        
+        Returns
+        -------
+        array
+        """
+        rank = np.floor(q * (self.count - 1))
+        cumulative = self.zeros[:, None] + np.cumsum(self.bins, axis=1)
+        column = (cumulative <= rank[:, None]).sum(axis=1)
+        value = 2 * self.gamma**(self.low + column) / (self.gamma + 1)
+        value = np.where(self.zeros > rank, 0.0, value)
+        return np.where(self.count > 0, value, np.nan)
+    
+    def Fixation(self):
+        """
+        Share of the replicates with only Altruistic agents (fixation), and with none (loss),
+        in each generation
+        
+        Returns
+        -------
+        two arrays
+        """
+        fixed = np.divide(self.fixed, self.count, out=np.full(len(self.count), np.nan), where=self.count > 0)
+        lost = np.divide(self.lost, self.count, out=np.full(len(self.count), np.nan), where=self.count > 0)
+        return fixed, lost
+    
+    def Report(self, quantiles = (0.05, 0.25, 0.5, 0.75, 0.95)):
+        """
+        Columns of statistics, one row per generation
+        
+        Returns
+        -------
+        dict of arrays: "count", "mean", "variance", "q<quantile>" for each quantile, "fixation", "loss"
+        """
+        fixed, lost = self.Fixation()
+        report = {"count": self.count.copy(), "mean": self.mean.copy(), "variance": self.Variance()}
+        for q in quantiles:
+            report["q{:g}".format(q)] = self.Quantile(q)
+        report["fixation"] = fixed
+        report["loss"] = lost
+        return report
+
+SWEEP_PARAMETERS = {"total_group": int, "total_agent": int, "t": int, "conflict": int,
+                    "baseline_value": float, "b": float, "c": float, "e": float, "m": float, "k": float,
+                    "fixation": float, "window": int, "tolerance": float, "budget": float}
+
+def _SweepRun(parameters, seed_sequence, cache = None):
+    """
+    Run one simulation of a sweep in a worker process, its random stream comes from the seed sequence
+    
+    Returns
+    -------
+    Number of Altruistic and Non-Altruistic agents over time, lists, and the reason Run stopped early
+    """
+    values = dict(parameters)
+    simulation = Simulation(values.pop("total_group"), values.pop("total_agent"), values.pop("t"),
+                            bool(values.pop("conflict", False)), seed=seed_sequence, cache=cache, **values)
+    simulation.Run()
+    return simulation.Number_of_Altruists, simulation.Number_of_NonAltruists, simulation.stop_reason
+
+def Sweep(grid, replicates = 1, processes = None, seed = None, output = None, progress = True, checkpoint = None,
+          cache = None):
+    """
+    Run Simulation over a grid of parameters on a process pool.
+    Run i of the sweep always gets the i-th child of the root SeedSequence,
+    so the results do not depend on the number of workers.
+    
+    Parameters
+    ----------
+    grid: dict of parameter name to list of values (every combination is run), 
+          or list of dicts (one parameter set each). Simulation arguments, 
+          total_group, total_agent and t are required
+    replicates: runs of each parameter set, default value 1
+    processes: worker processes, default all cores
+    seed: entropy of the root SeedSequence, default None (fresh entropy)
+    output: .npz file to save the columns to, default None
+    progress: print the finished runs, default True
+    checkpoint: directory each finished run is saved to (run-<i>.npz), runs already there are
+        not run again, so an interrupted sweep can be resumed with the same arguments; the root
+        entropy is kept there too, default None
+    cache: ResultCache directory shared by the runs, see Simulation, default None
+    
+    Returns
+    -------
+    dict of columns, one row per run: the parameters, "replicate", the
+    "altruists" / "nonaltruists" trajectories (runs, longest t), padded with -1 (floats if 
+    an engine is "meanfield"),
+    "stopped_at" (generations run) and "stop_reason" ("" if the run went the whole time)
+    """
+    if isinstance(grid, dict):
+        names = list(grid)
+        parameter_sets = [dict(zip(names, values)) for values in itertools.product(*[grid[name] for name in names])]
+    else:
+        parameter_sets = [dict(parameters) for parameters in grid]
+    for parameters in parameter_sets:
+        for name in parameters:
+            if name not in SWEEP_PARAMETERS and name != "engine":
+                raise ValueError("unknown sweep parameter {}".format(name))
+    
+    runs = [(parameters, replicate) for parameters in parameter_sets for replicate in range(replicates)]
+    if checkpoint is not None:
+        os.makedirs(checkpoint, exist_ok=True)
+        path = os.path.join(checkpoint, "sweep.json")
+        if os.path.exists(path):
+            with open(path) as file:
+                saved = json.load(file)
+            if seed is not None and seed != saved["entropy"]:
+                raise ValueError("{} holds a sweep with another seed".format(checkpoint))
+            seed = saved["entropy"]
+        else:
+            seed = np.random.SeedSequence(seed).entropy
+            with open(path, "w") as file:
+                json.dump({"entropy": seed}, file)
+    root = np.random.SeedSequence(seed)
+    seeds = root.spawn(len(runs))
+    longest = max([parameters["t"] for parameters in parameter_sets] + [0])
+    dtype = np.float64 if any(parameters.get("engine") == "meanfield" for parameters in parameter_sets) else np.int64
+    altruists = np.full((len(runs), longest), -1, dtype=dtype)
+    nonaltruists = np.full((len(runs), longest), -1, dtype=dtype)
+    stopped_at = np.zeros(len(runs), dtype=np.int64)
+    stop_reason = np.full(len(runs), "", dtype="<U8")
+    
+    def Finished(i, count_a, count_n, reason):
+        altruists[i, :len(count_a)] = count_a
+        nonaltruists[i, :len(count_n)] = count_n
+        stopped_at[i] = len(count_a)
+        stop_reason[i] = reason or ""
+    
+    pending = []
+    for i in range(len(runs)):
+        path = None if checkpoint is None else os.path.join(checkpoint, "run-{:06d}.npz".format(i))
+        if path is not None and os.path.exists(path):
+            with np.load(path) as run:
+                if json.loads(str(run["parameters"])) != _Plain([runs[i][0], runs[i][1]]):
+                    raise ValueError("{} holds a different sweep".format(checkpoint))
+                Finished(i, run["altruists"], run["nonaltruists"], str(run["stop_reason"]))
+        else:
+            pending.append(i)
+    
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = {pool.submit(_SweepRun, runs[i][0], seeds[i], cache): i for i in pending}
+        for done, future in enumerate(as_completed(futures), len(runs) - len(pending) + 1):
+            i = futures[future]
+            count_a, count_n, reason = future.result()
+            Finished(i, count_a, count_n, reason)
+            if checkpoint is not None:
+                path = os.path.join(checkpoint, "run-{:06d}.npz".format(i))
+                with open(path + ".tmp", "wb") as file:
+                    np.savez(file, altruists=np.array(count_a), nonaltruists=np.array(count_n),
+                             stop_reason=np.array(reason or ""), parameters=json.dumps(_Plain([runs[i][0], runs[i][1]])))
+                os.replace(path + ".tmp", path)
+            if progress:
+                print("run {}/{} done".format(done, len(runs)), file=sys.stderr, flush=True)
+    
+    columns = {}
+    for name in sorted(set(name for parameters in parameter_sets for name in parameters)):
+        columns[name] = np.array([parameters.get(name) for parameters, replicate in runs])
+    columns["replicate"] = np.array([replicate for parameters, replicate in runs], dtype=np.int64)
+    columns["altruists"] = altruists
+    columns["nonaltruists"] = nonaltruists
+    columns["stopped_at"] = stopped_at
+    columns["stop_reason"] = stop_reason
+    columns["root_entropy"] = np.array(str(root.entropy))
+    if output is not None:
+        np.savez_compressed(output, **columns)
+    return columns
+
+def _AggregateRuns(parameters, seed_sequences, relative_accuracy):
+    """
+    Run replicates of one parameter set in a worker process and fold them into an aggregator
+    
+    Returns
+    -------
+    ReplicateAggregator
+    """
+    aggregator = ReplicateAggregator(relative_accuracy)
+    for seed_sequence in seed_sequences:
+        values = dict(parameters)
+        simulation = Simulation(values.pop("total_group"), values.pop("total_agent"), values.pop("t"),
+                                bool(values.pop("conflict", False)), seed=seed_sequence, **values)
+        altruists = []
+        nonaltruists = []
+        for record in simulation.iter_generations():
+            altruists.append(record.altruists)
+            nonaltruists.append(record.nonaltruists)
+        aggregator.Add(altruists, nonaltruists) #one fold per replicate
+    return aggregator
+
+def Aggregate(parameters, replicates, processes = None, seed = None, blocks = None, relative_accuracy = 0.01):
+    """
+    Statistics of many replicates of one parameter set, without keeping their trajectories.
+    The replicates are split in blocks, each worker folds a block into its own 
+    ReplicateAggregator, and the aggregators are merged. Replicate i always gets the i-th
+    child of the root SeedSequence.
+    
+    Parameters
+    ----------
+    parameters: Simulation arguments, total_group, total_agent and t are required
+    replicates: number of runs
+    processes: worker processes, default all cores
+    seed: entropy of the root SeedSequence, default None (fresh entropy)
+    blocks: blocks of replicates, default 4 per worker
+    relative_accuracy: see ReplicateAggregator
+    
+    Returns
+    -------
+    ReplicateAggregator
+    """
+    seeds = np.random.SeedSequence(seed).spawn(replicates)
+    if blocks is None:
+        blocks = 4 * (processes or os.cpu_count() or 1)
+    bounds = np.linspace(0, replicates, min(blocks, max(replicates, 1)) + 1).astype(np.int64)
+    aggregator = ReplicateAggregator(relative_accuracy)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(_AggregateRuns, parameters, seeds[bounds[i]:bounds[i+1]], relative_accuracy)
+                   for i in range(len(bounds) - 1)]
+        for future in as_completed(futures):
+            aggregator.Merge(future.result())
+    return aggregator
+
+def Backend_equivalence(replicates = 40, t = 100, threshold = 4.0):
+    """
+    Check that the numpy and numba backends are statistically equivalent: 
+    Welch's t statistic of the mean number of Altruistic agents at the end 
+    of the runs, without and with war. Used by test_backends.py and benchmark.py
+    
+    Parameters
+    ----------
+    replicates: runs of each backend
+    t: time of each run
+    threshold: largest accepted |t statistic|
+    
+    Returns
+    -------
+    list of rows (conflict, numpy mean, numba mean, t statistic, equivalent)
+    """
+    rows = []
+    for conflict in (False, True):
+        final = {}
+        for backend in ("numpy", "numba"):
+            final[backend] = []
+            for seed in range(replicates):
+                simulation = Simulation(20, 400, t, conflict, seed=seed, backend=backend)
+                simulation.Run()
+                final[backend].append(simulation.Number_of_Altruists[-1])
+        a = np.array(final["numpy"], dtype=float)
+        b = np.array(final["numba"], dtype=float)
+        spread = np.sqrt(a.var(ddof=1) / len(a) + b.var(ddof=1) / len(b))
+        statistic = 0.0 if spread == 0 else (a.mean() - b.mean()) / spread
+        rows.append((conflict, a.mean(), b.mean(), statistic, abs(statistic) < threshold))
+    return rows
+
+def Main(argv = None):
+    """
+    Command line: without arguments run the two test cases, 
+    with "sweep" run a parameter sweep, see --help
+    
+    Returns
+    -------
+    None
+    """
+    parser = argparse.ArgumentParser(description="Agent-based model of multi-level selection")
+    commands = parser.add_subparsers(dest="command")
+    sweep = commands.add_parser("sweep", help="run Simulation over every combination of the given values")
+    for name, kind in SWEEP_PARAMETERS.items():
+        sweep.add_argument("--" + name, type=kind, nargs="+", required=name in ("total_group", "total_agent", "t"))
+    sweep.add_argument("--engine", nargs="+")
+    sweep.add_argument("--replicates", type=int, default=1)
+    sweep.add_argument("--processes", type=int, default=None)
+    sweep.add_argument("--seed", type=int, default=None)
+    sweep.add_argument("--output", default="sweep.npz")
+    sweep.add_argument("--checkpoint", default=None, help="directory of finished runs, to resume the sweep")
+    sweep.add_argument("--cache", default=None, help="directory of the result cache")
+    arguments = parser.parse_args(argv)
+    
+    if arguments.command == "sweep":
+        grid = {name: getattr(arguments, name) for name in list(SWEEP_PARAMETERS) + ["engine"]
+                if getattr(arguments, name) is not None}
+        Sweep(grid, arguments.replicates, arguments.processes, arguments.seed, arguments.output,
+              checkpoint=arguments.checkpoint, cache=arguments.cache)
+        return
+    
+    """set, group = 20, total agent = 400, time = 100, war = False """
+    test_case_1 = Simulation(20,400,100) #without war
     test_case_1.Run()
-    test_case_1.Plot()
+    test_case_1.Plot(show=True)
     
     """set, group = 20, total agent = 400, time = 100, war = True """
     
     test_case_2 = Simulation(20,400,100,True) #with war
     test_case_2.Run()
-    test_case_2.Plot()
+    test_case_2.Plot(show=True)
+
+"""Main script"""
+if __name__ == '__main__':
+    Main()
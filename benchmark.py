@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+
+Benchmarks for the agent-based model of multi-level selection.
+
+    python benchmark.py
+    python benchmark.py suite --quick --output results.json --baseline baseline.json
+
+@author: Md Mohidul Haque
+"""
+
+"""import modules"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+from GroupSelection_ABM_Md_Mohidul_Haque import Backend_equivalence, BatchSimulation, Evolution, GroupOfAgent, Simulation
+
+QUICK_AGENTS = (10**3, 10**4, 10**5)
+QUICK_GROUPS = (10, 100, 1000)
+FULL_AGENTS = (10**3, 10**4, 10**5, 10**6, 10**7)
+FULL_GROUPS = (10, 100, 1000, 10**4, 10**5)
+
+"""Define functions"""
+
+def Legacy_fitness_determination(group, payoff):
+    """
+    Parent pool of one group by spinning the roulette wheel once per agent,
+    the way Evolution.Fitness_determination used to do it
+
+    Returns
+    -------
+    parent pool, list
+    """
+    groups_total_payoff = sum(payoff)
+    probability = [payoff[j]/groups_total_payoff for j in range(len(group))]
+    pool = []
+    for k in range(len(group)):
+        pool.append(np.random.choice(group, p=probability))
+    return pool
+
+def Timer(function, repeat = 3, minimum = 0.5):
+    """
+    Best wall time of a function, called at least repeat times and for at least minimum
+    seconds, so cases of a few milliseconds get many calls. Other load on the machine 
+    only adds time, so the fastest call is the steadiest measure
+
+    Returns
+    -------
+    seconds, float
+    """
+    best = float("inf")
+    calls = 0
+    start = time.perf_counter()
+    while calls < repeat or time.perf_counter() - start < minimum:
+        begin = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - begin)
+        calls += 1
+    return best
+
+def Fitness_scaling(group_sizes = (10, 100, 1000, 10000, 100000), legacy_limit = 10000):
+    """
+    Time the roulette wheel selection of one group against the group size,
+    before (one np.random.choice per agent) and after (one draw per group)
+
+    Parameters
+    ----------
+    group_sizes: group sizes to time
+    legacy_limit: largest group size timed with the old per agent loop, it is quadratic
+
+    Returns
+    -------
+    list of rows (group size, method, seconds)
+    """
+    rows = []
+    for size in group_sizes:
+        groups = [list(np.random.randint(0, 2, size))]
+        for method in ("legacy", "searchsorted", "multinomial", "alias"):
+            if method == "legacy" and size > legacy_limit:
+                continue
+            process = Evolution(groups, selection = "searchsorted" if method == "legacy" else method)
+            process.GroupsLength()
+            process.Those_agents_play()
+            process.Getting_group_partner()
+            process.Payoff()
+            process.NonPlayerPayoff()
+            if method == "legacy":
+                group = list(process.population[0])
+                payoff = list(process.NonPlayerPayoff())
+                seconds = Timer(lambda: Legacy_fitness_determination(group, payoff), repeat = 1)
+            else:
+                seconds = Timer(process.Fitness_determination)
+            rows.append((size, method, seconds))
+    return rows
+
+def Batch_timing(cases = ((20, 400), (1000, 100000)), replicates = 256, t = 5, seed = 1):
+    """
+    Time a generation of BatchSimulation for many replicates, without and with war
+
+    Parameters
+    ----------
+    cases: list of (total_group, total_agent)
+    replicates: replicates of each batch
+    t: generations of each batch
+
+    Returns
+    -------
+    list of rows (total_group, total_agent, conflict, seconds per generation)
+    """
+    rows = []
+    for (total_group, total_agent), conflict in itertools.product(cases, (False, True)):
+        batch = BatchSimulation(replicates, total_group, total_agent, t, conflict, seed=seed)
+        seconds = Timer(batch.Run, repeat = 1)
+        rows.append((total_group, total_agent, conflict, seconds / t))
+    return rows
+
+def Suite_cases(agents = QUICK_AGENTS, groups = QUICK_GROUPS, conflicts = (False, True), smallest_group = 2):
+    """
+    Every combination of total agents, total groups and conflict, 
+    leaving out the ones with groups smaller than smallest_group agents
+
+    Returns
+    -------
+    list of (total_group, total_agent, conflict)
+    """
+    return [(total_group, total_agent, conflict) for total_agent, total_group, conflict in itertools.product(agents, groups, conflicts)
+            if total_agent // total_group >= smallest_group]
+
+def Suite(cases, t = 5, seed = 1, repeat = 3, minimum = 0.5):
+    """
+    Time each case: GroupOfAgent.Setup and SetupPopulation, every phase of a generation
+    (from Simulation's profiler) and a full Simulation.Run of t generations.
+    The throughput of a case is agents times generations per second of Run.
+
+    Parameters
+    ----------
+    cases: list of (total_group, total_agent, conflict), see Suite_cases
+    t: generations of each run
+    seed: seed of every run, so all runs of a case do the same work
+    repeat: runs of each timing at least, the best one is kept
+    minimum: seconds each timing lasts at least, see Timer
+
+    Returns
+    -------
+    dict: "meta" (machine and settings), "results" (one dict per case)
+    """
+    results = []
+    for total_group, total_agent, conflict in cases:
+        setup = Timer(lambda: GroupOfAgent(total_group, total_agent, np.random.default_rng(seed)).Setup(), repeat, minimum)
+        setup_population = Timer(lambda: GroupOfAgent(total_group, total_agent, np.random.default_rng(seed)).SetupPopulation(),
+                                 repeat, minimum)
+        profiled = Simulation(total_group, total_agent, t, conflict, seed=seed, profile=True)
+        profiled.Run()
+        phases = {name: phase["seconds"] / phase["calls"] for name, phase in profiled.Profile().items()}
+        run = Timer(lambda: Simulation(total_group, total_agent, t, conflict, seed=seed).Run(), repeat, minimum)
+        results.append({"name": "{}x{}{}".format(total_group, total_agent, "-war" if conflict else ""),
+                        "total_group": total_group, "total_agent": total_agent, "group_size": total_agent // total_group,
+                        "conflict": conflict, "setup_seconds": setup, "setup_population_seconds": setup_population,
+                        "phase_seconds": phases, "run_seconds": run, "throughput": total_agent * t / run})
+    meta = {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+            "processor": platform.processor(), "cpus": os.cpu_count(), "t": t, "seed": seed, "repeat": repeat,
+            "minimum": minimum}
+    return {"meta": meta, "results": results}
+
+def Compare(results, baseline, threshold = 0.2):
+    """
+    Cases whose throughput fell more than threshold (a fraction) below the baseline's,
+    cases missing from either side are not compared
+
+    Returns
+    -------
+    list of rows (name, baseline throughput, throughput, change)
+    """
+    before = {case["name"]: case["throughput"] for case in baseline["results"]}
+    regressions = []
+    for case in results["results"]:
+        if case["name"] in before:
+            change = case["throughput"] / before[case["name"]] - 1
+            if change < -threshold:
+                regressions.append((case["name"], before[case["name"]], case["throughput"], change))
+    return regressions
+
+def Main(argv = None):
+    """
+    Command line: without arguments print the selection and backend tables,
+    with "suite" run the scaling suite, see --help
+
+    Returns
+    -------
+    exit status, 1 if the suite regressed against the baseline
+    """
+    parser = argparse.ArgumentParser(description="Benchmarks of the agent-based model")
+    commands = parser.add_subparsers(dest="command")
+    suite = commands.add_parser("suite", help="time Setup, the phases and Run over agents, groups and conflict")
+    suite.add_argument("--quick", action="store_true", help="up to 10^5 agents and 10^3 groups")
+    suite.add_argument("--t", type=int, default=5)
+    suite.add_argument("--seed", type=int, default=1)
+    suite.add_argument("--repeat", type=int, default=3)
+    suite.add_argument("--minimum", type=float, default=0.5, help="seconds each timing runs at least")
+    suite.add_argument("--output", default="benchmark.json")
+    suite.add_argument("--baseline", default=None, help="results to compare the throughput with")
+    suite.add_argument("--threshold", type=float, default=0.2, help="largest accepted throughput drop, a fraction")
+    arguments = parser.parse_args(argv)
+    
+    if arguments.command == "suite":
+        if arguments.quick:
+            cases = Suite_cases(QUICK_AGENTS, QUICK_GROUPS)
+        else:
+            cases = Suite_cases(FULL_AGENTS, FULL_GROUPS)
+        results = Suite(cases, arguments.t, arguments.seed, arguments.repeat, arguments.minimum)
+        with open(arguments.output, "w") as file:
+            json.dump(results, file, indent=1)
+        print("{:>22} {:>12} {:>12} {:>14}".format("case", "setup", "run", "agents*t/s"))
+        for case in results["results"]:
+            print("{:>22} {:>12.6f} {:>12.6f} {:>14.0f}".format(case["name"], case["setup_population_seconds"], 
+                                                               case["run_seconds"], case["throughput"]))
+        if arguments.baseline is None:
+            return 0
+        with open(arguments.baseline) as file:
+            baseline = json.load(file)
+        regressions = Compare(results, baseline, arguments.threshold)
+        if regressions: #time the regressed cases again, a slow spell of the machine does not last
+            again = [(case["total_group"], case["total_agent"], case["conflict"]) for case in results["results"]
+                     if case["name"] in set(row[0] for row in regressions)]
+            retry = {case["name"]: case for case in Suite(again, arguments.t, arguments.seed, arguments.repeat,
+                                                          arguments.minimum)["results"]}
+            results["results"] = [max(case, retry.get(case["name"], case), key=lambda case: case["throughput"])
+                                  for case in results["results"]]
+            with open(arguments.output, "w") as file:
+                json.dump(results, file, indent=1)
+            regressions = Compare(results, baseline, arguments.threshold)
+        for name, before, after, change in regressions:
+            print("regression {}: {:.0f} -> {:.0f} agents*t/s ({:+.1%})".format(name, before, after, change), file=sys.stderr)
+        return 1 if regressions else 0
+    
+    print("{:>10} {:>14} {:>12}".format("group size", "selection", "seconds"))
+    for size, method, seconds in Fitness_scaling():
+        print("{:>10} {:>14} {:>12.6f}".format(size, method, seconds))
+    
+    print("{:>10} {:>12} {:>10} {:>12}".format("groups", "agents", "conflict", "256 batch s"))
+    for total_group, total_agent, conflict, seconds in Batch_timing():
+        print("{:>10} {:>12} {:>10} {:>12.6f}".format(total_group, total_agent, str(conflict), seconds))
+    
+    print("{:>10} {:>12} {:>12} {:>12} {:>12}".format("conflict", "numpy", "numba", "t statistic", "equivalent"))
+    for conflict, numpy_mean, numba_mean, statistic, equivalent in Backend_equivalence():
+        print("{:>10} {:>12.1f} {:>12.1f} {:>12.2f} {:>12}".format(str(conflict), numpy_mean, numba_mean, statistic, str(equivalent)))
+    return 0
+
+"""Main script"""
+if __name__ == '__main__':
+    sys.exit(Main())
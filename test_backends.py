@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+
+Tests of the numba backend against the numpy backend.
+
+    python -m pytest test_backends.py
+
+@author: Md Mohidul Haque
+"""
+
+"""import modules"""
+import numpy as np
+import pytest
+
+pytest.importorskip("numba")
+
+from GroupSelection_ABM_Md_Mohidul_Haque import Backend_equivalence, Simulation
+
+"""Define tests"""
+
+@pytest.mark.parametrize("backend", ["numpy", "numba"])
+def test_population_is_conserved_without_war(backend):
+    simulation = Simulation(20, 400, 50, seed=1, backend=backend)
+    simulation.Run()
+    total = np.add(simulation.Number_of_Altruists, simulation.Number_of_NonAltruists)
+    assert (total == 400).all()
+
+@pytest.mark.parametrize("backend", ["numpy", "numba"])
+@pytest.mark.parametrize("conflict", [False, True])
+def test_traits_are_zero_or_one(backend, conflict):
+    simulation = Simulation(20, 400, 50, conflict, seed=2, backend=backend)
+    simulation.Run()
+    population = simulation.population
+    traits = population.traits[:population.number_of_agents]
+    assert set(np.unique(traits)) <= {0, 1}
+    assert population.Altruists().sum() == simulation.Number_of_Altruists[-1]
+
+def test_backends_are_equivalent():
+    for conflict, numpy_mean, numba_mean, statistic, equivalent in Backend_equivalence(replicates=40, t=100):
+        assert equivalent, "conflict={}: numpy {:.1f}, numba {:.1f}, t = {:.2f}".format(
+            conflict, numpy_mean, numba_mean, statistic)